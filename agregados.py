@@ -0,0 +1,115 @@
+"""Estructuras de agregados en memoria que usa reporte.py y que se guardan en la caché
+compartida entre procesos. Viven en su propio módulo para que se puedan deserializar en
+cualquier proceso: Streamlit ejecuta reporte.py como `__main__`.
+"""
+import numpy as np
+import pandas as pd
+
+
+class MatrizDiaria:
+    """Pedidos completados de un año en una matriz densa restaurante × día del año.
+    Las series diaria, semanal y mensual de cualquier restaurante salen de cortes de
+    su fila, sin volver a consultar la base de datos."""
+
+    def __init__(self, anio, df):
+        self.anio = anio
+        self.inicio = np.datetime64(f"{anio:04d}-01-01", "D")
+        self.fechas = np.arange(self.inicio, np.datetime64(f"{anio + 1:04d}-01-01", "D"))
+        meses = np.arange(np.datetime64(f"{anio:04d}-01", "M"), np.datetime64(f"{anio + 1:04d}-01", "M"))
+        self.inicio_meses = (meses.astype("datetime64[D]") - self.inicio).astype(np.int64)
+        self.semanas = pd.DatetimeIndex(self.fechas).isocalendar()["week"].to_numpy(np.int64)
+        self.ids = np.unique(df["id_restaurant"].to_numpy(np.int64))
+        self.conteos = np.zeros((len(self.ids), len(self.fechas)), dtype=np.int32)
+        filas = np.searchsorted(self.ids, df["id_restaurant"].to_numpy(np.int64))
+        dias = (pd.to_datetime(df["fecha"]).to_numpy().astype("datetime64[D]") - self.inicio).astype(np.int64)
+        np.add.at(self.conteos, (filas, dias), df["pedidos"].to_numpy(np.int32))
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.conteos.nbytes + self.ids.nbytes + self.fechas.nbytes + self.semanas.nbytes
+
+    def serie(self, id_restaurante):
+        i = np.searchsorted(self.ids, id_restaurante)
+        if i < len(self.ids) and self.ids[i] == id_restaurante:
+            return self.conteos[i]
+        return np.zeros(len(self.fechas), dtype=np.int32)
+
+    def _dias(self, inicio, fin):
+        """Rango [a, b) de columnas entre las fechas inicio y fin, ambas incluidas."""
+        a = (np.datetime64(pd.Timestamp(inicio).date(), "D") - self.inicio).astype(np.int64)
+        b = (np.datetime64(pd.Timestamp(fin).date(), "D") - self.inicio).astype(np.int64) + 1
+        return int(np.clip(a, 0, len(self.fechas))), int(np.clip(b, 0, len(self.fechas)))
+
+    def diario(self, id_restaurante, inicio=None, fin=None):
+        """Días con pedidos del periodo (por defecto el año): columnas fecha, pedidos."""
+        a, b = (0, len(self.fechas)) if inicio is None else self._dias(inicio, fin)
+        pedidos = self.serie(id_restaurante)[a:b]
+        con_pedidos = pedidos > 0
+        return pd.DataFrame({"fecha": self.fechas[a:b][con_pedidos].astype("datetime64[ns]"), "pedidos": pedidos[con_pedidos]})
+
+    def semanal(self, id_restaurante, inicio, fin):
+        """Pedidos por semana ISO del periodo; solo semanas con pedidos."""
+        a, b = self._dias(inicio, fin)
+        totales = np.bincount(self.semanas[a:b], weights=self.serie(id_restaurante)[a:b]).astype(np.int64)
+        semanas = np.flatnonzero(totales)
+        return pd.DataFrame({"semana": semanas, "pedidos": totales[semanas]})
+
+    def mensual(self, id_restaurante):
+        """Pedidos por mes y variación porcentual contra el mes previo, del primer al
+        último mes con pedidos."""
+        pedidos = np.add.reduceat(self.serie(id_restaurante).astype(np.int64), self.inicio_meses)
+        con_pedidos = np.flatnonzero(pedidos)
+        if len(con_pedidos) == 0:
+            return pd.DataFrame({"fecha": pd.to_datetime([]), "pedidos": np.array([], dtype=np.int64), "variacion": np.array([], dtype=float)})
+        pedidos = pedidos[con_pedidos[0]:con_pedidos[-1] + 1]
+        anterior = np.r_[np.nan, pedidos[:-1]]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variacion = (pedidos / anterior - 1) * 100
+        variacion[~np.isfinite(variacion)] = np.nan
+        meses = self.inicio_meses[con_pedidos[0]:con_pedidos[-1] + 1]
+        return pd.DataFrame({"fecha": self.fechas[meses].astype("datetime64[ns]"), "pedidos": pedidos, "variacion": variacion})
+
+
+class AcumuladorCeldas:
+    """Agrega coordenadas por lotes en celdas de `resolucion` grados sin conservar los
+    puntos: guarda el peso de cada celda y las sumas del centroide, así que la memoria
+    depende del número de celdas distintas y no del de pedidos."""
+
+    def __init__(self, resolucion):
+        self.resolucion = resolucion
+        self.claves = np.empty((0, 2), dtype=np.int64)
+        self.pesos = np.empty(0, dtype=np.float64)
+        self.n = 0
+        self.suma = np.zeros(2)
+
+    def __sizeof__(self):
+        return object.__sizeof__(self) + self.claves.nbytes + self.pesos.nbytes
+
+    def agregar(self, lat, lon, pesos=None):
+        puntos = np.column_stack([np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)])
+        pesos = np.ones(len(puntos)) if pesos is None else np.asarray(pesos, dtype=float)
+        validos = np.isfinite(puntos).all(axis=1)
+        puntos, pesos = puntos[validos], pesos[validos]
+        if len(puntos) == 0:
+            return
+        self.n += len(puntos)
+        self.suma += puntos.sum(axis=0)
+        celdas = np.floor(puntos / self.resolucion).astype(np.int64)
+        unicas, inverso = np.unique(np.concatenate([self.claves, celdas]), axis=0, return_inverse=True)
+        self.pesos = np.bincount(inverso.ravel(), weights=np.concatenate([self.pesos, pesos]), minlength=len(unicas))
+        self.claves = unicas
+
+    @property
+    def centro(self):
+        return None if self.n == 0 else (self.suma / self.n).tolist()
+
+    def celdas(self, max_puntos):
+        """Las `max_puntos` celdas más pesadas: columnas lat, lon (centro de celda) y peso."""
+        claves, pesos = self.claves, self.pesos
+        if len(claves) > max_puntos:
+            mayores = np.argpartition(pesos, -max_puntos)[-max_puntos:]
+            claves, pesos = claves[mayores], pesos[mayores]
+        return pd.DataFrame({
+            "lat": (claves[:, 0] + 0.5) * self.resolucion,
+            "lon": (claves[:, 1] + 0.5) * self.resolucion,
+            "peso": pesos,
+        })
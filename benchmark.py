@@ -0,0 +1,239 @@
+"""Benchmark del pipeline del reporte con datos sintéticos y el motor local de motor_local.py.
+
+Uso:
+    python benchmark.py --restaurantes 200 --pedidos-mes 50000 --meses 12 --salida bench.json
+    python benchmark.py ... --base bench_anterior.json   # compara contra una corrida previa
+    python benchmark.py --backend sqlserver --mes 2025-05  # contra la base de DB_SERVER
+
+Genera `tbl_orders`, `tbl_restaurants`, `tbl_address_client`, `addresses` y `ctl_payment`
+a la escala indicada, los escribe como instantánea en Parquet y mide cada paso del
+pipeline llamando a las funciones consulta_* de reporte.py con `DATA_BACKEND=local`, es
+decir, pasando por backend(), la instrumentación y la caché de consultas. Ambas cachés se
+desactivan para que cada repetición ejecute la consulta. Con `--backend sqlserver` los
+mismos pasos leen de SQL Server por leer_sql. El resultado es un JSON con la mediana y
+el mínimo en milisegundos de cada paso.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+import reporte
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+# Una línea de métricas por consulta ensuciaría el JSON de salida
+reporte.log_metricas.setLevel(logging.WARNING)
+
+# Pesos relativos por hora del día: picos de comida y cena
+PERFIL_HORARIO = np.array([1,1,0,0,0,0,1,2,4,5,6,8,14,16,12,8,6,7,11,15,14,10,6,3], dtype=float)
+
+
+def generar_datos(restaurantes=200, pedidos_mes=50000, meses=12, clientes=None, fin=None, semilla=0):
+    """Tablas sintéticas con el esquema de `[dev_apprisa_delivery].[dbo]`."""
+    rng = np.random.default_rng(semilla)
+    clientes = clientes or max(1000, pedidos_mes // 5)
+    fin = fin or datetime(datetime.now().year, datetime.now().month, 1)
+    inicio = fin - relativedelta(months=meses)
+    n = pedidos_mes * meses
+
+    tbl_restaurants = pd.DataFrame({
+        "id_restaurant": np.arange(1, restaurantes + 1, dtype=np.int64),
+        "name_restaurant": [f"Restaurante {i:04d}" for i in range(1, restaurantes + 1)],
+    })
+    ctl_payment = pd.DataFrame({
+        "id_payment": [1, 2, 3, 4, 5, 7],
+        "payment": ["Efectivo", "Tarjeta", "Transferencia", "SPEI", "Terminal", "Depósito"],
+    })
+    centro = np.array([19.43, -99.13])
+    tbl_address_client = pd.DataFrame({
+        "id_address": np.arange(1, clientes + 1, dtype=np.int64),
+        "latitude": centro[0] + rng.normal(0, 0.05, clientes),
+        "longitude": centro[1] + rng.normal(0, 0.05, clientes),
+    })
+    # Un 20 % de las direcciones de cliente no tiene coordenadas; se usan las de `addresses`
+    sin_coordenadas = rng.random(clientes) < 0.2
+    tbl_address_client.loc[sin_coordenadas, ["latitude", "longitude"]] = np.nan
+    addresses = pd.DataFrame({
+        "ad_id": np.arange(1, clientes + 1, dtype=np.int64),
+        "ad_latitude": centro[0] + rng.normal(0, 0.05, clientes),
+        "ad_longitude": centro[1] + rng.normal(0, 0.05, clientes),
+    })
+
+    popularidad = 1 / np.arange(1, restaurantes + 1) ** 0.8
+    restaurante = rng.choice(tbl_restaurants["id_restaurant"].to_numpy(), size=n, p=popularidad / popularidad.sum())
+    dias = (fin - inicio).days
+    dia = rng.integers(0, dias, size=n)
+    hora = rng.choice(24, size=n, p=PERFIL_HORARIO / PERFIL_HORARIO.sum())
+    segundos = rng.integers(0, 3600, size=n)
+    completado = np.datetime64(inicio) + (dia * 86400 + hora * 3600 + segundos).astype("timedelta64[s]")
+    llegada = completado - rng.integers(0, 120, size=n).astype("timedelta64[s]")
+    salida = llegada - rng.integers(10 * 60, 45 * 60, size=n).astype("timedelta64[s]")
+    aceptado = salida - rng.integers(5 * 60, 30 * 60, size=n).astype("timedelta64[s]")
+    id_cliente = rng.integers(1, clientes + 1, size=n)
+    tbl_orders = pd.DataFrame({
+        "id_order": np.arange(1, n + 1, dtype=np.int64),
+        "restaurant": restaurante,
+        "status": np.where(rng.random(n) < 0.9, 24, 25),
+        "order_completion_date": completado.astype("datetime64[ns]"),
+        "order_acceptance_date": aceptado.astype("datetime64[ns]"),
+        "start_delivery_datetime": salida.astype("datetime64[ns]"),
+        "arrival_client_date": llegada.astype("datetime64[ns]"),
+        "payment": rng.choice(ctl_payment["id_payment"].to_numpy(), size=n, p=[0.35, 0.35, 0.1, 0.05, 0.1, 0.05]),
+        "total": rng.gamma(4, 60, size=n).round(2),
+        "costo_envio": rng.choice([25.0, 30.0, 35.0, 45.0], size=n),
+        "costo_creditos": rng.integers(0, 5, size=n).astype(float),
+        "id_address": id_cliente,
+        "addresses_id": id_cliente,
+    })
+    return {
+        "tbl_orders": tbl_orders,
+        "tbl_restaurants": tbl_restaurants,
+        "tbl_address_client": tbl_address_client,
+        "addresses": addresses,
+        "ctl_payment": ctl_payment,
+    }
+
+
+def medir(funcion, repeticiones):
+    tiempos = []
+    resultado = None
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return resultado, {"ms_mediana": round(statistics.median(tiempos), 3), "ms_min": round(min(tiempos), 3), "repeticiones": repeticiones}
+
+
+def configurar(backend, carpeta=None):
+    """Apunta reporte.py al backend indicado y desactiva sus cachés; debe llamarse antes
+    de la primera consulta, que es cuando se crea la caché en memoria."""
+    reporte.DATA_BACKEND = backend
+    if carpeta:
+        reporte.SNAPSHOT_DIR = carpeta
+    reporte.SHARED_CACHE_DIR = ""
+    reporte.CACHE_MAX_ENTRADAS = 0
+
+
+def ejecutar(anio, mes, repeticiones=5):
+    """Mide el pipeline del reporte para un mes: ranking, detalle del primer
+    establecimiento y las derivaciones y gráficas locales. Los pasos consulta_* llaman a
+    las funciones homónimas de reporte.py; los pasos *_backend leen las filas crudas del
+    backend, que alimentan a las derivaciones locales."""
+    resultados = {}
+    inicio_mes, fin_mes = reporte.limites_mes(anio, mes)
+    inicio_anio = datetime(anio, 1, 1)
+    fin_anio = datetime(anio, 12, 31, 23, 59, 59)
+    inicio_ant, fin_ant = reporte.limites_mes(*(inicio_mes - relativedelta(months=1)).timetuple()[:2])
+
+    df_top, resultados["consulta_top10_metricas"] = medir(lambda: reporte.consulta_top10_metricas(inicio_mes, fin_mes, reporte.TOP_N, 0), repeticiones)
+    _, resultados["tabla_top10"] = medir(lambda: reporte.tabla_top10(df_top), repeticiones)
+    id_restaurante = int(df_top["id_restaurant"].iloc[0])
+
+    _, resultados["consulta_celdas_mes"] = medir(lambda: reporte.consulta_celdas_mes(id_restaurante, inicio_mes, fin_mes), repeticiones)
+    _, resultados["consulta_celdas_flujo"] = medir(lambda: reporte.consulta_celdas_flujo(id_restaurante, inicio_mes, fin_mes).celdas(reporte.HEATMAP_MAX_PUNTOS), repeticiones)
+    _, resultados["consulta_matriz_diaria"] = medir(lambda: reporte.consulta_matriz_diaria(anio), repeticiones)
+    _, resultados["consulta_detalle_restaurante"] = medir(lambda: reporte.consulta_detalle_restaurante(id_restaurante, inicio_mes, fin_mes), repeticiones)
+    _, resultados["consulta_pedidos_agregados"] = medir(lambda: reporte.consulta_pedidos_agregados(inicio_mes - relativedelta(microseconds=1), fin_mes), repeticiones)
+    franjas, resultados["consulta_pedidos_franja"] = medir(lambda: reporte.consulta_pedidos_franja(inicio_mes, fin_mes, 15), repeticiones)
+
+    filas, resultados["pedidos_restaurante_backend"] = medir(lambda: reporte.backend().pedidos_restaurante(id_restaurante, inicio_ant, fin_mes), repeticiones)
+    df_diaria_anio, resultados["diaria_restaurantes_backend"] = medir(lambda: reporte.backend().diaria_restaurantes(inicio_anio, fin_anio), repeticiones)
+    (df_horas, _), resultados["derivar_detalle_local"] = medir(lambda: (
+        reporte._pedidos_hora_locales(filas, inicio_mes, fin_mes),
+        reporte._resumen_local(filas.assign(creditos=filas["creditos"].fillna(0)), inicio_mes, fin_mes),
+    ), repeticiones)
+    _, resultados["ventana_pico_horaria"] = medir(lambda: reporte.ventana_pico_horaria(df_horas, 0.8), repeticiones)
+    _, resultados["ventanas_pico_restaurantes"] = medir(lambda: reporte.ventanas_pico_restaurantes(franjas, 0.8, 15), repeticiones)
+    matriz, resultados["construir_matriz_diaria"] = medir(lambda: reporte.MatrizDiaria(anio, df_diaria_anio), repeticiones)
+    _, resultados["series_matriz_diaria"] = medir(lambda: (
+        matriz.diario(id_restaurante, inicio_mes, fin_mes),
+        matriz.semanal(id_restaurante, inicio_mes, fin_mes),
+        matriz.mensual(id_restaurante),
+    ), repeticiones)
+    _, resultados["tabla_y_grafico_mensual"] = medir(lambda: reporte.tabla_y_grafico_mensual(matriz.mensual(id_restaurante)), repeticiones)
+    _, resultados["analisis_textual"] = medir(lambda: reporte.analisis_textual(df_horas, matriz.semanal(id_restaurante, inicio_mes, fin_mes), "bench"), repeticiones)
+    acumulador = reporte.consulta_celdas_flujo(id_restaurante, inicio_mes, fin_mes)
+    _, resultados["mapa_calor"] = medir(lambda: reporte.mapa_calor(acumulador.celdas(reporte.HEATMAP_MAX_PUNTOS), acumulador.centro).get_root().render(), repeticiones)
+    coords = pd.concat(reporte.backend().coordenadas_lotes(id_restaurante, inicio_mes, fin_mes, reporte.HEATMAP_LOTE), ignore_index=True).dropna()
+    _, resultados["mapa_calor_puntos"] = medir(lambda: reporte.mapa_calor(coords).get_root().render(), repeticiones)
+    return resultados
+
+
+def comparar(actual, base):
+    print(f"{'paso':32} {'base ms':>10} {'actual ms':>10} {'razón':>7}")
+    for paso, medida in actual.items():
+        previo = base.get(paso)
+        if previo is None:
+            print(f"{paso:32} {'-':>10} {medida['ms_mediana']:>10.2f} {'-':>7}")
+            continue
+        razon = medida["ms_mediana"] / previo["ms_mediana"] if previo["ms_mediana"] else float("nan")
+        print(f"{paso:32} {previo['ms_mediana']:>10.2f} {medida['ms_mediana']:>10.2f} {razon:>7.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark del reporte con datos sintéticos.")
+    parser.add_argument("--restaurantes", type=int, default=200)
+    parser.add_argument("--pedidos-mes", type=int, default=50000)
+    parser.add_argument("--meses", type=int, default=12)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--datos", help="carpeta donde guardar (o reutilizar) las tablas sintéticas en Parquet")
+    parser.add_argument("--backend", choices=["local", "sqlserver"], default="local", help="origen de los datos; sqlserver usa las variables DB_*")
+    parser.add_argument("--mes", type=lambda t: datetime.strptime(t, "%Y-%m"), help="mes a medir, AAAA-MM (por defecto el penúltimo de los datos)")
+    parser.add_argument("--salida", help="archivo JSON de resultados")
+    parser.add_argument("--base", help="JSON de una corrida previa para comparar")
+    args = parser.parse_args(argv)
+
+    if args.backend == "sqlserver":
+        if args.mes is None:
+            parser.error("--mes es obligatorio con --backend sqlserver")
+        configurar("sqlserver")
+        carga_ms, escala = None, None
+        mes = args.mes
+        resultados = ejecutar(mes.year, mes.month, args.repeticiones)
+    else:
+        with tempfile.TemporaryDirectory() as temporal:
+            carpeta = args.datos or temporal
+            inicio = time.perf_counter()
+            if not os.path.exists(os.path.join(carpeta, "tbl_orders.parquet")):
+                tablas = generar_datos(args.restaurantes, args.pedidos_mes, args.meses, semilla=args.semilla)
+                os.makedirs(carpeta, exist_ok=True)
+                for nombre, df in tablas.items():
+                    df.to_parquet(os.path.join(carpeta, f"{nombre}.parquet"), index=False)
+            configurar("local", carpeta)
+            motor = reporte.motor_local()
+            carga_ms = round((time.perf_counter() - inicio) * 1000, 1)
+            escala = {"restaurantes": args.restaurantes, "pedidos_mes": args.pedidos_mes, "meses": args.meses, "pedidos_completados": len(motor.completados)}
+            mes = args.mes or motor.completados["order_completion_date"].max() - relativedelta(months=1)
+            resultados = ejecutar(mes.year, mes.month, args.repeticiones)
+    informe = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {"python": platform.python_version(), "plataforma": platform.platform(), "pandas": pd.__version__, "numpy": np.__version__},
+        "backend": args.backend,
+        "escala": escala,
+        "carga_ms": carga_ms,
+        "cache_consultas": reporte.cache_consultas().estadisticas(),
+        "resultados": resultados,
+    }
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(texto)
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            comparar(resultados, json.load(f)["resultados"])
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Genera sin Streamlit los reportes de un rango de meses y de su top N de establecimientos.
+
+Uso:
+    python generar_reportes.py --desde 2025-01 --hasta 2025-06 --salida reportes
+
+Por cada mes escribe en `<salida>/<AAAA-MM>/` el ranking (`top.html`, `top.json`,
+`top.parquet`) y, por cada establecimiento del ranking, `restaurantes/<id>.html`,
+`<id>.json` y `<id>_diario.parquet`. Los establecimientos se procesan en paralelo en
+un pool de procesos arrancados con `spawn`: cada proceso abre sus propias conexiones en
+lugar de heredar por `fork` las del pool del proceso principal.
+"""
+import argparse
+import html
+import json
+import logging
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+import reporte
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+
+def _mes(texto):
+    return datetime.strptime(texto, "%Y-%m")
+
+
+def _a_json(valor):
+    if hasattr(valor, "item"):
+        return valor.item()
+    if isinstance(valor, (pd.Timestamp, datetime)):
+        return valor.isoformat()
+    return str(valor)
+
+
+def _sin_nan(valor):
+    """NaN, infinitos y NaT pasan a None: json.dump los escribiría como NaN, que no es JSON."""
+    if isinstance(valor, dict):
+        return {k: _sin_nan(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_sin_nan(v) for v in valor]
+    if valor is pd.NaT:
+        return None
+    if hasattr(valor, "item") and not isinstance(valor, pd.Timestamp):
+        valor = valor.item()
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    return valor
+
+
+def _guardar_json(ruta, datos):
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump(_sin_nan(datos), f, ensure_ascii=False, indent=2, default=_a_json, allow_nan=False)
+
+
+def _markdown_html(texto):
+    """HTML del markdown de analisis_textual: párrafos, listas con "- " y **negrita**."""
+    partes = []
+    for bloque in texto.split("\n\n"):
+        lineas = [re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", html.escape(l)) for l in bloque.splitlines()]
+        if lineas and all(l.startswith("- ") for l in lineas):
+            partes.append("<ul>" + "".join(f"<li>{l[2:]}</li>" for l in lineas) + "</ul>")
+        else:
+            partes.append(f"<p>{'<br>'.join(lineas)}</p>")
+    return "\n".join(partes)
+
+
+def obtener_top(inicio_mes, fin_mes, top_n):
+    if reporte.ROLLUP_DIR:
+        return reporte.rollup_top10(inicio_mes, fin_mes, top_n, 0)
+    return reporte.consulta_top10_metricas(inicio_mes, fin_mes, top_n, 0)
+
+
+def reporte_restaurante(fila, anio, mes, carpeta):
+    """Calcula y escribe el reporte de un establecimiento; se ejecuta en un proceso del pool."""
+    inicio_mes, fin_mes = reporte.limites_mes(anio, mes)
+    titulo_mes = f"{reporte.MESES_ES[mes]} {anio}"
+    id_restaurante = int(fila["id_restaurant"])
+    detalle = reporte.detalle_restaurante(id_restaurante, inicio_mes, fin_mes)
+    matriz = reporte.matriz_diaria(anio)
+    df_horas = detalle["horas"]
+    df_diario = matriz.diario(id_restaurante)
+    texto_picos, texto_semana = reporte.analisis_textual(df_horas, matriz.semanal(id_restaurante, inicio_mes, fin_mes), titulo_mes)
+    ventana = reporte.ventana_pico_horaria(df_horas, 0.8, reporte.PICO_CIRCULAR)
+    tabla_m, fig_m = reporte.tabla_y_grafico_mensual(matriz.mensual(id_restaurante))
+    pedidos_mes, dias_activos_mes, creditos_mes = detalle["resumen_mes"]
+    pedidos_ant, dias_activos_ant, creditos_ant = detalle["resumen_ant"]
+
+    base = os.path.join(carpeta, "restaurantes", str(id_restaurante))
+    _guardar_json(f"{base}.json", {
+        "id_restaurant": id_restaurante,
+        "name_restaurant": fila["name_restaurant"],
+        "mes": titulo_mes,
+        "metricas": fila,
+        "resumen_mes": {"pedidos": pedidos_mes, "dias_activos": dias_activos_mes, "creditos": creditos_mes},
+        "resumen_mes_anterior": {"pedidos": pedidos_ant, "dias_activos": dias_activos_ant, "creditos": creditos_ant},
+        "ventana_pico": None if ventana is None else {"inicio": ventana[0], "fin": ventana[1], "porcentaje": ventana[2], "total": ventana[3]},
+        "pedidos_por_hora": df_horas.to_dict(orient="records"),
+        "mensual": [] if tabla_m is None else tabla_m.fillna(0).to_dict(orient="records"),
+        "texto_picos": texto_picos,
+        "texto_semana": texto_semana,
+    })
+    df_diario.to_parquet(f"{base}_diario.parquet", index=False)
+    partes = [
+        f"<h1>{html.escape(str(fila['name_restaurant']))} • {titulo_mes}</h1>",
+        _markdown_html(texto_picos),
+        _markdown_html(texto_semana),
+    ]
+    if fig_m is not None:
+        partes.append(fig_m.to_html(full_html=False, include_plotlyjs="cdn"))
+        partes.append(tabla_m.fillna(0).to_html(index=False))
+    with open(f"{base}.html", "w", encoding="utf-8") as f:
+        f.write("\n".join(partes))
+    return id_restaurante
+
+
+def generar_mes(anio, mes, top_n, salida, pool):
+    inicio_mes, fin_mes = reporte.limites_mes(anio, mes)
+    carpeta = os.path.join(salida, f"{anio:04d}-{mes:02d}")
+    os.makedirs(os.path.join(carpeta, "restaurantes"), exist_ok=True)
+    df_top = obtener_top(inicio_mes, fin_mes, top_n)
+    # Deja calculados en disco los agregados que comparten todos los establecimientos del
+    # mes antes de repartirlos, para que los procesos no los recalculen cada uno
+    if reporte.ROLLUP_DIR:
+        reporte.rollup_pedidos(anio, mes)
+    reporte.matriz_diaria(anio)
+    df_top.to_parquet(os.path.join(carpeta, "top.parquet"), index=False)
+    _guardar_json(os.path.join(carpeta, "top.json"), df_top.to_dict(orient="records"))
+    with open(os.path.join(carpeta, "top.html"), "w", encoding="utf-8") as f:
+        f.write(f"<h1>Top {len(df_top)} • {reporte.MESES_ES[mes]} {anio}</h1>\n")
+        f.write(reporte.tabla_top10(df_top).to_html(index=False))
+    return [pool.submit(reporte_restaurante, fila, anio, mes, carpeta) for fila in df_top.to_dict(orient="records")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precalcula reportes mensuales del top N sin Streamlit.")
+    parser.add_argument("--desde", type=_mes, required=True, help="primer mes, AAAA-MM")
+    parser.add_argument("--hasta", type=_mes, required=True, help="último mes, AAAA-MM")
+    parser.add_argument("--top", type=int, default=reporte.TOP_N, help="establecimientos por mes")
+    parser.add_argument("--salida", default="reportes", help="carpeta de salida")
+    parser.add_argument("--procesos", type=int, default=4, help="procesos en paralelo")
+    args = parser.parse_args(argv)
+
+    futuros = []
+    with ProcessPoolExecutor(max_workers=args.procesos, mp_context=multiprocessing.get_context("spawn")) as pool:
+        mes = args.desde
+        while mes <= args.hasta:
+            futuros += generar_mes(mes.year, mes.month, args.top, args.salida, pool)
+            mes += relativedelta(months=1)
+        errores = 0
+        for futuro in as_completed(futuros):
+            try:
+                futuro.result()
+            except Exception as e:
+                errores += 1
+                print(f"Error generando un reporte: {e}")
+    print(f"{len(futuros) - errores} reportes generados en {args.salida}")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,123 @@
+"""Motor local que reproduce con pandas las consultas de reporte.py sobre tablas en memoria
+o en archivos Parquet con el mismo esquema que `[dev_apprisa_delivery].[dbo]`.
+
+Cada método devuelve las mismas columnas que el método homónimo de
+reporte.BackendSQLServer, así que sirve como backend del reporte sobre la instantánea
+de sincronizar_snapshot.py y como motor del benchmark.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+TABLAS = ["tbl_orders", "tbl_restaurants", "tbl_address_client", "addresses", "ctl_payment"]
+DIAS = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
+
+
+def _minutos(desde, hasta):
+    """Equivalente a DATEDIFF(MINUTE, desde, hasta): cuenta cruces de minuto."""
+    return (hasta.dt.floor("min") - desde.dt.floor("min")) / pd.Timedelta(minutes=1)
+
+
+class MotorLocal:
+    def __init__(self, tablas):
+        self.restaurantes = tablas["tbl_restaurants"].set_index("id_restaurant")
+        self.pagos = tablas["ctl_payment"].rename(columns={"payment": "nombre_pago"}).set_index("id_payment")
+        self.direcciones_cliente = tablas["tbl_address_client"].set_index("id_address")
+        self.direcciones = tablas["addresses"].set_index("ad_id")
+        pedidos = tablas["tbl_orders"]
+        pedidos = pedidos.astype({c: "datetime64[ns]" for c in ["order_completion_date","order_acceptance_date","start_delivery_datetime","arrival_client_date"]})
+        completados = pedidos[pedidos["status"] == 24].sort_values("order_completion_date", kind="stable")
+        self.completados = completados.reset_index(drop=True)
+        self._por_restaurante = {k: v.reset_index(drop=True) for k, v in self.completados.groupby("restaurant", sort=False)}
+
+    @classmethod
+    def desde_parquet(cls, carpeta):
+        return cls({t: pd.read_parquet(os.path.join(carpeta, f"{t}.parquet")) for t in TABLAS})
+
+    def _rango(self, inicio, fin, restaurante=None):
+        """Pedidos completados con order_completion_date BETWEEN inicio AND fin."""
+        df = self.completados if restaurante is None else self._por_restaurante.get(int(restaurante), self.completados.iloc[:0])
+        fechas = df["order_completion_date"].to_numpy()
+        a = np.searchsorted(fechas, np.datetime64(pd.Timestamp(inicio)), side="left")
+        b = np.searchsorted(fechas, np.datetime64(pd.Timestamp(fin)), side="right")
+        return df.iloc[a:b]
+
+    def _latlon(self, df):
+        lat = df["id_address"].map(self.direcciones_cliente["latitude"]).fillna(df["addresses_id"].map(self.direcciones["ad_latitude"]))
+        lon = df["id_address"].map(self.direcciones_cliente["longitude"]).fillna(df["addresses_id"].map(self.direcciones["ad_longitude"]))
+        return lat.astype(float), lon.astype(float)
+
+    def top10_metricas(self, inicio_dt, fin_dt, limite, desplazamiento):
+        o = self._rango(inicio_dt, fin_dt)
+        o = o[o["restaurant"].isin(self.restaurantes.index)]
+        base = o[o["payment"].isin(self.pagos.index) & o["id_address"].isin(self.direcciones_cliente.index)]
+        grupo = base["restaurant"]
+        nombre_pago = base["payment"].map(self.pagos["nombre_pago"])
+        ticket = (base["total"] + base["costo_envio"]).where(~base["payment"].isin([3,4]))
+        m = pd.DataFrame({
+            "numPedido": grupo.value_counts(),
+            "numClients": base.groupby("restaurant")["id_address"].nunique(),
+            "ticketAvg": ticket.groupby(grupo).mean().round(2),
+            "deliveryTimeAvg": np.trunc(_minutos(base["start_delivery_datetime"], base["arrival_client_date"]).groupby(grupo).mean()),
+            "deliveryWaitTimeAvg": np.trunc(_minutos(base["order_acceptance_date"], base["start_delivery_datetime"]).groupby(grupo).mean()),
+            "ordersToCard": ((nombre_pago != "Efectivo") & ~base["payment"].isin([3,7,4])).groupby(grupo).sum(),
+            "ordersToCash": (nombre_pago == "Efectivo").groupby(grupo).sum(),
+            "ordersToTransference": base["payment"].isin([3,7,4]).groupby(grupo).sum(),
+        }).rename_axis("id_restaurant").reset_index()
+        m = m.sort_values(["numPedido","id_restaurant"], ascending=[False, True]).iloc[desplazamiento:desplazamiento + limite]
+        m.insert(1, "name_restaurant", m["id_restaurant"].map(self.restaurantes["name_restaurant"]).to_numpy())
+        pagina = o[o["restaurant"].isin(m["id_restaurant"])]
+        por_dia = pd.crosstab(pagina["restaurant"], pagina["order_completion_date"].dt.day_name()).reindex(columns=DIAS, fill_value=0)
+        m = m.merge(por_dia, left_on="id_restaurant", right_index=True, how="left")
+        m[DIAS] = m[DIAS].fillna(0).astype(np.int32)
+        columnas = ["id_restaurant","name_restaurant","numClients","ticketAvg","deliveryTimeAvg","deliveryWaitTimeAvg","ordersToCard","ordersToCash","ordersToTransference"] + DIAS
+        return m[columnas].astype({"id_restaurant": np.int32, "numClients": np.int32, "deliveryTimeAvg": np.float32, "deliveryWaitTimeAvg": np.float32, "ordersToCard": np.int32, "ordersToCash": np.int32, "ordersToTransference": np.int32}).reset_index(drop=True)
+
+    def coordenadas_lotes(self, id_restaurante, inicio_dt, fin_dt, lote):
+        o = self._rango(inicio_dt, fin_dt, id_restaurante)
+        for i in range(0, len(o), lote):
+            lat, lon = self._latlon(o.iloc[i:i + lote])
+            yield pd.DataFrame({"lat": lat.to_numpy(np.float32), "lon": lon.to_numpy(np.float32)})
+
+    def celdas_mes(self, id_restaurante, inicio_dt, fin_dt, resolucion, max_puntos):
+        lat, lon = self._latlon(self._rango(inicio_dt, fin_dt, id_restaurante))
+        celdas = pd.DataFrame({"celda_lat": np.floor(lat / resolucion), "celda_lon": np.floor(lon / resolucion)}).dropna()
+        df = celdas.groupby(["celda_lat","celda_lon"]).size().reset_index(name="peso")
+        return df.sort_values("peso", ascending=False, kind="stable").head(max_puntos).astype({"peso": np.int32}).reset_index(drop=True)
+
+    def diaria_restaurantes(self, inicio_dt, fin_dt):
+        o = self._rango(inicio_dt, fin_dt)
+        df = pd.DataFrame({"id_restaurant": o["restaurant"].to_numpy(np.int32), "fecha": o["order_completion_date"].dt.normalize().to_numpy()})
+        return df.groupby(["id_restaurant","fecha"]).size().reset_index(name="pedidos").astype({"pedidos": np.int32})
+
+    def pedidos_restaurante(self, id_restaurante, desde, hasta):
+        o = self._rango(desde, hasta, id_restaurante)
+        return pd.DataFrame({
+            "fecha_hora": o["order_completion_date"].to_numpy(),
+            "creditos": o["costo_creditos"].to_numpy(np.float32),
+        })
+
+    def pedidos_agregados(self, desde_excl, fin_dt):
+        o = self._rango(desde_excl, fin_dt)
+        o = o[o["order_completion_date"] > pd.Timestamp(desde_excl)]
+        fechas = o["order_completion_date"]
+        df = pd.DataFrame({
+            "id_restaurant": o["restaurant"].to_numpy(np.int32),
+            "fecha": fechas.dt.normalize().to_numpy(),
+            "hora": fechas.dt.hour.to_numpy(np.int32),
+            "creditos": o["costo_creditos"].fillna(0).to_numpy(float),
+            "ultima": fechas.to_numpy(),
+        })
+        g = df.groupby(["id_restaurant","fecha","hora"], as_index=False)
+        return g.agg(pedidos=("creditos", "size"), creditos=("creditos", "sum"), ultima=("ultima", "max")).astype({"pedidos": np.int32})
+
+    def pedidos_franja(self, inicio_dt, fin_dt, minutos):
+        o = self._rango(inicio_dt, fin_dt)
+        fechas = o["order_completion_date"]
+        df = pd.DataFrame({
+            "id_restaurant": o["restaurant"].to_numpy(np.int32),
+            "dia_semana": fechas.dt.dayofweek.to_numpy(np.int32),
+            "minuto": ((fechas.dt.hour * 60 + fechas.dt.minute) // minutos * minutos).to_numpy(np.int32),
+        })
+        return df.groupby(["id_restaurant","dia_semana","minuto"]).size().reset_index(name="pedidos").astype({"pedidos": np.int32})
@@ -8,11 +8,34 @@ from dateutil.relativedelta import relativedelta
 from textwrap import dedent
 import pyodbc
 import folium
+from motor_local import MotorLocal
+from agregados import AcumuladorCeldas, MatrizDiaria
 from folium.plugins import HeatMap, Fullscreen
 from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 import os
 from dotenv import load_dotenv
 import hashlib
+import threading
+import time
+import sys
+import functools
+import decimal
+import datetime as dt
+import json
+import logging
+import contextvars
+import pickle
+from collections import deque
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import pyarrow as pa
+import pyarrow.parquet as pq
+try:
+    import fcntl
+except ImportError:  # Windows: la caché compartida funciona sin bloqueo entre procesos
+    fcntl = None
 
 # Cargar variables de entorno
 load_dotenv()
@@ -53,20 +76,6 @@ def check_password():
         # Contraseña correcta
         return True
 
-# Configuración de la página
-st.set_page_config(page_title="Top 10 por Mes", page_icon="🏆", layout="wide")
-
-# Verificar autenticación antes de mostrar la aplicación
-if not check_password():
-    st.stop()  # No ejecutar el resto del código si no está autenticado
-
-# Botón de logout en la sidebar
-with st.sidebar:
-    st.markdown("---")
-    if st.button("🚪 Cerrar Sesión"):
-        st.session_state["password_correct"] = False
-        st.rerun()
-
 MESES_ES = {1:"Enero",2:"Febrero",3:"Marzo",4:"Abril",5:"Mayo",6:"Junio",7:"Julio",8:"Agosto",9:"Septiembre",10:"Octubre",11:"Noviembre",12:"Diciembre"}
 
 def conexion_bd():
@@ -76,158 +85,1150 @@ def conexion_bd():
     password = os.getenv('DB_PASSWORD')
     driver = '{ODBC Driver 17 for SQL Server}'
     conn_str = f'DRIVER={driver};SERVER={server};DATABASE={database};UID={username};PWD={password}'
-    return pyodbc.connect(conn_str)
+    conn = pyodbc.connect(conn_str, timeout=int(os.getenv('DB_LOGIN_TIMEOUT', 15)))
+    # Con respaldo, una consulta lenta también debe poder pasar a la instantánea
+    conn.timeout = int(os.getenv('DB_QUERY_TIMEOUT') or (30 if DATA_BACKEND == "auto" else 0))
+    return conn
+
+class PoolConexiones:
+    """Pool de conexiones pyodbc reutilizables, compartido entre sesiones y reruns."""
+
+    def __init__(self, fabrica, tamano=5, max_inactividad=300, verificar_tras=30, espera=30):
+        self._fabrica = fabrica
+        self._tamano = tamano
+        self._max_inactividad = max_inactividad
+        self._verificar_tras = verificar_tras
+        self._espera = espera
+        self._libres = []  # (conexion, ultimo_uso)
+        self._abiertas = 0
+        self._cond = threading.Condition()
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except pyodbc.Error:
+            pass
+
+    def _sana(self, conn):
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.fetchone()
+            cur.close()
+            return True
+        except pyodbc.Error:
+            return False
+
+    def _desalojar_inactivas(self):
+        ahora = time.monotonic()
+        vigentes = []
+        for conn, ultimo_uso in self._libres:
+            if ahora - ultimo_uso > self._max_inactividad:
+                self._cerrar(conn)
+                self._abiertas -= 1
+            else:
+                vigentes.append((conn, ultimo_uso))
+        self._libres = vigentes
+
+    def obtener(self):
+        limite = time.monotonic() + self._espera
+        with self._cond:
+            while True:
+                self._desalojar_inactivas()
+                if self._libres:
+                    conn, ultimo_uso = self._libres.pop()
+                    break
+                if self._abiertas < self._tamano:
+                    self._abiertas += 1
+                    conn, ultimo_uso = None, None
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise TimeoutError("No hay conexiones disponibles en el pool")
+                self._cond.wait(restante)
+        if conn is not None:
+            # Solo se verifica la conexión si lleva un rato sin usarse
+            if time.monotonic() - ultimo_uso < self._verificar_tras or self._sana(conn):
+                return conn
+            self._cerrar(conn)
+        try:
+            return self._fabrica()
+        except Exception:
+            with self._cond:
+                self._abiertas -= 1
+                self._cond.notify()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        if not descartar:
+            try:
+                conn.rollback()
+            except pyodbc.Error:
+                descartar = True
+        with self._cond:
+            if descartar:
+                self._cerrar(conn)
+                self._abiertas -= 1
+            else:
+                self._libres.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def estadisticas(self):
+        with self._cond:
+            return {"abiertas": self._abiertas, "libres": len(self._libres), "tamano": self._tamano}
+
+    @contextmanager
+    def conexion(self):
+        conn = self.obtener()
+        descartar = False
+        try:
+            yield conn
+        except pyodbc.Error:
+            descartar = True
+            raise
+        finally:
+            self.devolver(conn, descartar)
+
+@st.cache_resource(show_spinner=False)
+def pool_conexiones():
+    return PoolConexiones(
+        conexion_bd,
+        tamano=int(os.getenv('DB_POOL_SIZE', 5)),
+        max_inactividad=float(os.getenv('DB_POOL_IDLE_SECONDS', 300)),
+        verificar_tras=float(os.getenv('DB_POOL_CHECK_SECONDS', 30)),
+    )
+
+# Instrumentación: cada consulta registra tiempos de conexión, ejecución y lectura, filas,
+# bytes y acierto de caché; cada sección de app() registra su tiempo de render. Los eventos
+# se guardan en memoria para el panel de administración y se emiten como logs JSON.
+log_metricas = logging.getLogger("reporte.metricas")
+if not log_metricas.handlers:
+    _manejador = logging.StreamHandler()
+    _manejador.setFormatter(logging.Formatter("%(message)s"))
+    log_metricas.addHandler(_manejador)
+    log_metricas.setLevel(os.getenv('METRICS_LOG_LEVEL', 'INFO'))
+    log_metricas.propagate = False
+
+_medicion_actual = contextvars.ContextVar("medicion_actual", default=None)
+
+class Metricas:
+    """Últimos eventos de consultas y secciones, compartidos entre sesiones."""
+
+    def __init__(self, max_eventos=500):
+        self._eventos = deque(maxlen=max_eventos)
+        self._lock = threading.Lock()
+
+    def registrar(self, evento):
+        evento = {"ts": datetime.now().isoformat(timespec="milliseconds"), **evento}
+        with self._lock:
+            self._eventos.append(evento)
+        log_metricas.info(json.dumps(evento, default=str))
+
+    def eventos(self):
+        with self._lock:
+            return list(self._eventos)
+
+@st.cache_resource(show_spinner=False)
+def metricas():
+    return Metricas(int(os.getenv('METRICS_MAX_EVENTS', 500)))
+
+@contextmanager
+def medir_consulta(nombre):
+    medicion = {"tipo": "consulta", "consulta": nombre, "cache": None, "conexion_ms": 0.0, "ejecucion_ms": 0.0, "lectura_ms": 0.0, "filas": 0, "bytes": 0}
+    token = _medicion_actual.set(medicion)
+    inicio = time.perf_counter()
+    try:
+        yield medicion
+    finally:
+        _medicion_actual.reset(token)
+        # Un resultado derivado de datos de respaldo no es definitivo para quien lo usa
+        exterior = _medicion_actual.get()
+        if medicion.get("respaldo") and exterior is not None:
+            exterior["respaldo"] = True
+        medicion["total_ms"] = (time.perf_counter() - inicio) * 1000
+        for clave in ("conexion_ms", "ejecucion_ms", "lectura_ms", "total_ms"):
+            medicion[clave] = round(medicion[clave], 1)
+        metricas().registrar(medicion)
+
+def instrumentada(funcion):
+    @functools.wraps(funcion)
+    def envoltura(*args, **kwargs):
+        with medir_consulta(funcion.__name__):
+            return funcion(*args, **kwargs)
+    return envoltura
+
+@contextmanager
+def medir_seccion(nombre):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        metricas().registrar({"tipo": "render", "seccion": nombre, "total_ms": round((time.perf_counter() - inicio) * 1000, 1)})
+
+# Caché de consultas: LRU acotada por entradas y memoria. Los periodos cerrados viven
+# mucho tiempo; los que contienen "ahora" caducan pronto para no servir datos viejos.
+CACHE_MAX_ENTRADAS = int(os.getenv('CACHE_MAX_ENTRIES', 256))
+CACHE_MAX_MB = float(os.getenv('CACHE_MAX_MB', 512))
+CACHE_TTL_CERRADO = float(os.getenv('CACHE_TTL_CLOSED_SECONDS', 86400))
+CACHE_TTL_ABIERTO = float(os.getenv('CACHE_TTL_OPEN_SECONDS', 300))
+# Los pedidos que se confirman tarde pueden llegar con una fecha anterior a la marca de
+# agua: un periodo sigue abierto, en la caché y en el almacén de agregados, hasta estas
+# horas después de su fin.
+ROLLUP_SOLAPAMIENTO = timedelta(hours=float(os.getenv('ROLLUP_OVERLAP_HOURS', 48)))
+
+def periodo_cerrado(fin):
+    return fin + ROLLUP_SOLAPAMIENTO < datetime.now()
+
+def _tamano_aprox(valor):
+    if isinstance(valor, pd.DataFrame):
+        return int(valor.memory_usage(index=True, deep=True).sum())
+    if isinstance(valor, dict):
+        return sys.getsizeof(valor) + sum(_tamano_aprox(v) for v in valor.values())
+    if isinstance(valor, (list, tuple)):
+        return sys.getsizeof(valor) + sum(_tamano_aprox(v) for v in valor)
+    return sys.getsizeof(valor)
+
+class CacheConsultas:
+    """Caché LRU compartida entre sesiones, con límite de entradas y de bytes y vigencia por entrada."""
+
+    def __init__(self, max_entradas, max_bytes):
+        self._datos = OrderedDict()  # clave -> (valor, tamano, expira)
+        self._max_entradas = max_entradas
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+
+    def _quitar(self, clave):
+        _, tamano, _ = self._datos.pop(clave)
+        self._bytes -= tamano
+
+    def obtener(self, clave):
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[2] < time.monotonic():
+                self._quitar(clave)
+                entrada = None
+            if entrada is None:
+                self.fallos += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.aciertos += 1
+            return True, entrada[0]
+
+    def guardar(self, clave, valor, ttl):
+        tamano = _tamano_aprox(valor)
+        with self._lock:
+            if clave in self._datos:
+                self._quitar(clave)
+            if tamano > self._max_bytes:
+                return
+            self._datos[clave] = (valor, tamano, time.monotonic() + ttl)
+            self._bytes += tamano
+            while len(self._datos) > self._max_entradas or self._bytes > self._max_bytes:
+                self._quitar(next(iter(self._datos)))
+                self.desalojos += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._datos),
+                "mb": round(self._bytes / 2**20, 2),
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "desalojos": self.desalojos,
+                "tasa_aciertos": round(self.aciertos / consultas, 3) if consultas else None,
+            }
+
+@st.cache_resource(show_spinner=False)
+def cache_consultas():
+    return CacheConsultas(CACHE_MAX_ENTRADAS, int(CACHE_MAX_MB * 2**20))
+
+# Caché compartida entre procesos: los resultados se serializan en disco, así que las
+# réplicas de Streamlit de la misma máquina no repiten la consulta. Un candado flock por
+# clave deja una sola ejecución en curso; los demás procesos esperan hasta
+# SHARED_CACHE_LOCK_SECONDS y reutilizan su resultado. Las entradas se leen con pickle,
+# que ejecuta código: solo el usuario de la aplicación debe poder escribir en la carpeta.
+SHARED_CACHE_DIR = os.getenv('SHARED_CACHE_DIR', '.cache_consultas')
+SHARED_CACHE_MAX_MB = float(os.getenv('SHARED_CACHE_MAX_MB', 1024))
+SHARED_CACHE_LOCK_SECONDS = float(os.getenv('SHARED_CACHE_LOCK_SECONDS', 120))
+
+def _version_codigo():
+    """Las entradas de otra versión del código no se reutilizan: incluye los módulos cuyas
+    clases y resultados se guardan serializados."""
+    resumen = hashlib.sha256()
+    carpeta = os.path.dirname(os.path.abspath(__file__))
+    for nombre in (os.path.basename(__file__), "agregados.py", "motor_local.py"):
+        with open(os.path.join(carpeta, nombre), "rb") as f:
+            resumen.update(f.read())
+    return resumen.hexdigest()[:16]
+
+VERSION_CODIGO = _version_codigo()
+
+def _normalizar(valor):
+    if isinstance(valor, (list, tuple)):
+        return tuple(_normalizar(v) for v in valor)
+    if isinstance(valor, np.generic):
+        return valor.item()
+    return valor
+
+class CacheCompartida:
+    """Resultados serializados con pickle en una carpeta local, con vigencia por entrada y
+    una sola ejecución en curso por clave entre todos los procesos."""
+
+    def __init__(self, carpeta, max_bytes):
+        self._carpeta = carpeta
+        self._max_bytes = max_bytes
+        self._escritos = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.esperas = 0
+        self.calculos = 0
+        os.makedirs(carpeta, mode=0o700, exist_ok=True)
+
+    def _ruta(self, clave):
+        resumen = hashlib.sha256(repr((VERSION_CODIGO, _normalizar(clave))).encode()).hexdigest()
+        return os.path.join(self._carpeta, resumen)
+
+    def _leer(self, ruta, solo_vigencia=False):
+        """La vigencia va serializada antes que el valor: una entrada vencida (o la poda,
+        con solo_vigencia=True) no deserializa el resultado."""
+        try:
+            with open(f"{ruta}.pkl", "rb") as f:
+                expira = pickle.load(f)
+                if expira <= time.time():
+                    return None
+                valor = None if solo_vigencia else pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Entrada truncada o ilegible: se recalcula y se sobrescribe
+            return None
+        return expira, valor
+
+    def _escribir(self, ruta, valor, ttl):
+        temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temporal, "wb") as f:
+                pickle.dump(time.time() + ttl, f, protocol=pickle.HIGHEST_PROTOCOL)
+                pickle.dump(valor, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporal, f"{ruta}.pkl")
+        except (OSError, pickle.PicklingError, AttributeError, TypeError) as e:
+            log_metricas.warning(json.dumps({"tipo": "cache_compartida", "error": repr(e)}))
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            return
+        with self._lock:
+            self._escritos += os.path.getsize(f"{ruta}.pkl")
+            podar = self._escritos > self._max_bytes / 10
+            if podar:
+                self._escritos = 0
+        if podar:
+            try:
+                self._podar()
+            except OSError as e:
+                # La poda es oportunista: un fallo no debe tumbar la consulta que ya calculó
+                log_metricas.warning(json.dumps({"tipo": "cache_compartida", "error": repr(e)}))
+
+    def _podar(self):
+        """Borra los resultados más antiguos hasta quedar en el 80% del límite y después
+        los candados de claves sin resultado vigente que nadie tiene tomados."""
+        entradas = []
+        for nombre in os.listdir(self._carpeta):
+            if nombre.endswith(".pkl"):
+                try:
+                    info = os.stat(os.path.join(self._carpeta, nombre))
+                except FileNotFoundError:
+                    continue
+                entradas.append((info.st_mtime, info.st_size, nombre))
+        total = sum(e[1] for e in entradas)
+        for _, tamano, nombre in sorted(entradas):
+            if total <= self._max_bytes * 0.8:
+                break
+            try:
+                os.remove(os.path.join(self._carpeta, nombre))
+            except OSError:
+                # Ya borrado, o abierto por otro proceso en Windows
+                pass
+            total -= tamano
+        if fcntl is None:
+            return  # sin flock no se crean candados
+        for nombre in os.listdir(self._carpeta):
+            if nombre.endswith(".lock"):
+                self._borrar_candado(os.path.join(self._carpeta, nombre[:-len(".lock")]))
+
+    def _borrar_candado(self, ruta):
+        """Borra el candado y el resultado vencido de una clave sin resultado vigente. El
+        candado se borra mientras se tiene tomado; quien ya lo había abierto lo detecta en
+        _tomar_candado y abre el nuevo."""
+        if self._leer(ruta, solo_vigencia=True) is not None:
+            return
+        try:
+            candado = open(f"{ruta}.lock", "ab")
+        except OSError:
+            return
+        with candado:
+            try:
+                fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # alguien está calculando esta clave
+            # Bajo el candado: la clave puede haberse escrito mientras tanto
+            if self._leer(ruta, solo_vigencia=True) is None:
+                for sufijo in (".pkl", ".lock"):
+                    try:
+                        os.remove(f"{ruta}{sufijo}")
+                    except OSError:
+                        pass
+
+    def _tomar_candado(self, ruta):
+        """Abre y toma en exclusiva el candado de la clave, reintentando sin bloqueo hasta
+        SHARED_CACHE_LOCK_SECONDS. Devuelve el archivo abierto, o None si vence el plazo,
+        p. ej. porque el proceso que calcula se quedó colgado. Si la poda borró el candado
+        mientras se esperaba, el archivo tomado ya no es el de la ruta y se vuelve a abrir."""
+        limite = time.monotonic() + SHARED_CACHE_LOCK_SECONDS
+        while True:
+            candado = open(f"{ruta}.lock", "ab")
+            try:
+                while True:
+                    try:
+                        fcntl.flock(candado, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        if time.monotonic() >= limite:
+                            candado.close()
+                            return None
+                        time.sleep(0.05)
+                try:
+                    vigente = os.stat(f"{ruta}.lock").st_ino == os.fstat(candado.fileno()).st_ino
+                except FileNotFoundError:
+                    vigente = False
+            except BaseException:
+                candado.close()
+                raise
+            if vigente:
+                return candado
+            candado.close()
+
+    def obtener_o_calcular(self, clave, calcular):
+        """calcular() devuelve (valor, segundos de vigencia), así la vigencia puede depender
+        del resultado. Devuelve (origen, valor, segundos de vigencia). origen es "hit" si ya estaba en
+        disco, "espera" si lo calculó otro proceso mientras este esperaba el candado y
+        "miss" si se calculó aquí, también cuando la espera superó el plazo."""
+        ruta = self._ruta(clave)
+        entrada = self._leer(ruta)
+        if entrada is not None:
+            with self._lock:
+                self.aciertos += 1
+            return "hit", entrada[1], entrada[0] - time.time()
+        if fcntl is None:
+            valor, ttl = calcular()
+            self._escribir(ruta, valor, ttl)
+            with self._lock:
+                self.calculos += 1
+            return "miss", valor, ttl
+        candado = self._tomar_candado(ruta)
+        if candado is None:
+            log_metricas.warning(json.dumps({"tipo": "cache_compartida", "error": "plazo de espera del candado vencido"}))
+            with self._lock:
+                self.calculos += 1
+            return ("miss", *calcular())
+        with candado:
+            try:
+                entrada = self._leer(ruta)
+                if entrada is not None:
+                    with self._lock:
+                        self.esperas += 1
+                    return "espera", entrada[1], entrada[0] - time.time()
+                valor, ttl = calcular()
+                self._escribir(ruta, valor, ttl)
+                with self._lock:
+                    self.calculos += 1
+                return "miss", valor, ttl
+            finally:
+                fcntl.flock(candado, fcntl.LOCK_UN)
+
+    def estadisticas(self):
+        archivos = [e for e in os.scandir(self._carpeta) if e.name.endswith(".pkl")]
+        with self._lock:
+            return {
+                "carpeta": self._carpeta,
+                "entradas": len(archivos),
+                "mb": round(sum(e.stat().st_size for e in archivos) / 2**20, 2),
+                "aciertos": self.aciertos,
+                "esperas": self.esperas,
+                "calculos": self.calculos,
+                "bloqueo_entre_procesos": fcntl is not None,
+            }
+
+@st.cache_resource(show_spinner=False)
+def cache_compartida():
+    if not SHARED_CACHE_DIR:
+        return None
+    return CacheCompartida(SHARED_CACHE_DIR, int(SHARED_CACHE_MAX_MB * 2**20))
+
+def cache_consulta(fin_periodo=None):
+    """Memoiza una consulta en cache_consultas() y, por debajo, en cache_compartida().
+    El periodo está abierto mientras su fin (por defecto el mayor datetime de los
+    argumentos) no quede fuera del solapamiento. Los resultados de la instantánea de respaldo se guardan marcados
+    y con la vigencia corta de un periodo abierto."""
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with medir_consulta(funcion.__name__) as medicion:
+                cache = cache_consultas()
+                # El origen de datos forma parte de la clave: una carpeta de caché común no
+                # mezcla resultados de SQL Server con los de una instantánea
+                clave = (funcion.__qualname__, DATA_BACKEND, SNAPSHOT_DIR, args, tuple(sorted(kwargs.items())))
+                encontrado, entrada = cache.obtener(clave)
+                medicion["cache"] = "hit" if encontrado else "miss"
+                if encontrado:
+                    valor, respaldo = entrada
+                    if respaldo:
+                        medicion["respaldo"] = True
+                    return valor
+                if fin_periodo is not None:
+                    fin = fin_periodo(*args, **kwargs)
+                else:
+                    fin = max((a for a in (*args, *kwargs.values()) if isinstance(a, datetime)), default=None)
+                abierto = fin is None or not periodo_cerrado(fin)
+
+                def calcular():
+                    valor = funcion(*args, **kwargs)
+                    respaldo = bool(medicion.get("respaldo"))
+                    return (valor, respaldo), CACHE_TTL_ABIERTO if abierto or respaldo else CACHE_TTL_CERRADO
+
+                compartida = cache_compartida()
+                if compartida is None:
+                    entrada, ttl = calcular()
+                else:
+                    origen, entrada, ttl = compartida.obtener_o_calcular(clave, calcular)
+                    medicion["cache"] = {"hit": "compartida", "espera": "espera"}.get(origen, "miss")
+                valor, respaldo = entrada
+                if respaldo:
+                    medicion["respaldo"] = True
+                cache.guardar(clave, entrada, ttl)
+                return valor
+        return envoltura
+    return decorador
+
+# Lectura de resultados por lotes directamente a columnas Arrow, con tipos compactos
+FETCH_LOTE = int(os.getenv('DB_FETCH_BATCH', 10000))
+TIPOS_ARROW = {
+    int: pa.int64(),
+    float: pa.float64(),
+    decimal.Decimal: pa.float64(),
+    bool: pa.bool_(),
+    str: pa.string(),
+    dt.datetime: pa.timestamp("us"),
+    dt.date: pa.date32(),
+}
+
+def _columna_arrow(valores, tipo):
+    try:
+        return pa.array(valores, type=tipo, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # p. ej. Decimal -> float64 o int -> float32: se deduce el tipo y se convierte
+        return pa.array(valores, from_pandas=True).cast(tipo)
+
+def leer_sql(sql, params=None, tipos=None):
+    """Ejecuta `sql` y materializa el resultado en un DataFrame respaldado por arrays Arrow.
+    `tipos` fija el tipo Arrow de columnas concretas (p. ej. int32 para conteos, float32
+    para coordenadas); el resto se deduce del tipo que reporta el driver."""
+    medicion = _medicion_actual.get()
+    if medicion is None:
+        with medir_consulta("leer_sql"):
+            return leer_sql(sql, params, tipos)
+    tipos = tipos or {}
+    t0 = time.perf_counter()
+    with pool_conexiones().conexion() as conn:
+        t1 = time.perf_counter()
+        cur = conn.cursor()
+        try:
+            cur.execute(sql, params or [])
+            t2 = time.perf_counter()
+            columnas = [d[0] for d in cur.description]
+            esquema = [tipos.get(c, TIPOS_ARROW.get(d[1], pa.string())) for c, d in zip(columnas, cur.description)]
+            trozos = [[] for _ in columnas]
+            while True:
+                filas = cur.fetchmany(FETCH_LOTE)
+                if not filas:
+                    break
+                for i, valores in enumerate(zip(*filas)):
+                    trozos[i].append(_columna_arrow(valores, esquema[i]))
+        finally:
+            cur.close()
+    tabla = pa.Table.from_arrays([pa.chunked_array(t, type=tipo) for t, tipo in zip(trozos, esquema)], names=columnas)
+    df = tabla.to_pandas(date_as_object=False, split_blocks=True, self_destruct=True)
+    medicion["conexion_ms"] += (t1 - t0) * 1000
+    medicion["ejecucion_ms"] += (t2 - t1) * 1000
+    medicion["lectura_ms"] += (time.perf_counter() - t2) * 1000
+    medicion["filas"] += len(df)
+    medicion["bytes"] += int(df.memory_usage(index=True, deep=True).sum())
+    return df
+
+class LectorLotes:
+    """Iterador de DataFrames de hasta `lote` filas sobre un cursor ya ejecutado. La
+    conexión vuelve al pool al agotarse, con close() (o al salir de un `with`) y, como
+    último recurso, cuando el lector se recolecta aunque nunca se haya iterado."""
+
+    def __init__(self, pool, conn, cur, tipos, lote, medicion):
+        self._pool = pool
+        self._conn = conn
+        self._cur = cur
+        self._lote = lote
+        self._medicion = medicion
+        self._columnas = [d[0] for d in cur.description]
+        self._esquema = [tipos.get(c, TIPOS_ARROW.get(d[1], pa.string())) for c, d in zip(self._columnas, cur.description)]
+        self._abierto = True
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if not self._abierto:
+            raise StopIteration
+        t = time.perf_counter()
+        try:
+            filas = self._cur.fetchmany(self._lote)
+            if not filas:
+                self.close()
+                raise StopIteration
+            df = pa.Table.from_arrays([_columna_arrow(v, tipo) for v, tipo in zip(zip(*filas), self._esquema)], names=self._columnas).to_pandas()
+        except StopIteration:
+            raise
+        except Exception as e:
+            self._cerrar(isinstance(e, pyodbc.Error))
+            raise
+        if self._medicion is not None:
+            self._medicion["lectura_ms"] += (time.perf_counter() - t) * 1000
+            self._medicion["filas"] += len(df)
+            self._medicion["bytes"] += int(df.memory_usage(index=True, deep=True).sum())
+        return df
+
+    def _cerrar(self, descartar):
+        if not self._abierto:
+            return
+        self._abierto = False
+        try:
+            self._cur.close()
+        except pyodbc.Error:
+            descartar = True
+        self._pool.devolver(self._conn, descartar)
+
+    def close(self):
+        self._cerrar(False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+def leer_sql_lotes(sql, params=None, tipos=None, lote=FETCH_LOTE):
+    """Ejecuta `sql` y devuelve un LectorLotes, sin materializar el resultado completo.
+    Los errores de conexión o ejecución se lanzan al llamar, donde BackendConRespaldo
+    puede pasar al respaldo; los que ocurren a mitad de la lectura se lanzan al iterar,
+    fuera de su alcance, y los recibe quien consume los lotes. Conviene consumirlo dentro
+    de un `with` para devolver la conexión aunque se abandone la lectura."""
+    medicion = _medicion_actual.get()
+    tipos = tipos or {}
+    pool = pool_conexiones()
+    t0 = time.perf_counter()
+    conn = pool.obtener()
+    t1 = time.perf_counter()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql, params or [])
+    except Exception as e:
+        cur.close()
+        pool.devolver(conn, isinstance(e, pyodbc.Error))
+        raise
+    t2 = time.perf_counter()
+    if medicion is not None:
+        medicion["conexion_ms"] += (t1 - t0) * 1000
+        medicion["ejecucion_ms"] += (t2 - t1) * 1000
+    return LectorLotes(pool, conn, cur, tipos, lote, medicion)
 
 def limites_mes(anio, mes):
     inicio = datetime(anio, mes, 1, 0, 0, 0)
     fin = (inicio + relativedelta(months=1)) - timedelta(seconds=1)
     return inicio, fin
 
-@st.cache_data(show_spinner=False)
-def consulta_top10_metricas(inicio_dt, fin_dt):
-    inicio_fn = inicio_dt.strftime('%Y-%m-%d')
-    fin_fn = (inicio_dt + relativedelta(months=1)).strftime('%Y-%m-%d')
-    inicio = inicio_dt.strftime('%Y-%m-%d %H:%M:%S')
-    fin = fin_dt.strftime('%Y-%m-%d %H:%M:%S')
-    sql = dedent(f"""
-    WITH Metrics AS (
-        SELECT
-            R.id_restaurant,
-            R.name_restaurant,
-            CAST(COUNT(O.id_order) AS INT) AS numPedido,
-            COUNT(DISTINCT AC.id_address) AS numClients,
-            CAST(AVG(CASE WHEN O.payment NOT IN (3,4) THEN (O.total + O.costo_envio) END) AS DECIMAL(10,2)) AS ticketAvg,
-            AVG(DATEDIFF(MINUTE, O.start_delivery_datetime, O.arrival_client_date)) AS deliveryTimeAvg,
-            AVG(DATEDIFF(MINUTE, O.order_acceptance_date, O.start_delivery_datetime)) AS deliveryWaitTimeAvg,
-            COUNT(CASE WHEN P.payment != 'Efectivo' AND O.payment NOT IN (3,7,4) THEN 1 END) AS ordersToCard,
-            COUNT(CASE WHEN P.payment = 'Efectivo' THEN 1 END) AS ordersToCash,
-            COUNT(CASE WHEN P.id_payment IN (3,7,4) THEN 1 END) AS ordersToTransference
-        FROM [dev_apprisa_delivery].[dbo].tbl_restaurants R
-        INNER JOIN [dev_apprisa_delivery].[dbo].tbl_orders O ON R.id_restaurant = O.restaurant
-        INNER JOIN [dev_apprisa_delivery].[dbo].ctl_payment P ON P.id_payment = O.payment
-        INNER JOIN [dev_apprisa_delivery].[dbo].tbl_address_client AC ON AC.id_address = O.id_address
-        WHERE O.order_completion_date BETWEEN '{inicio}' AND '{fin}' AND O.[status] = 24
-        GROUP BY R.id_restaurant,R.name_restaurant
-    ),
-    OrdersByDay AS (
+TOP_N = int(os.getenv('TOP_N', 10))
+
+HEATMAP_RESOLUCION = float(os.getenv('HEATMAP_RESOLUTION', 0.002))
+HEATMAP_MAX_PUNTOS = int(os.getenv('HEATMAP_MAX_POINTS', 2000))
+HEATMAP_LOTE = int(os.getenv('HEATMAP_STREAM_BATCH', 5000))
+HEATMAP_PROGRESO = float(os.getenv('HEATMAP_PROGRESS_SECONDS', 1))
+# 'stream': coordenadas leídas por lotes y agregadas aquí, con vista previa del avance;
+# 'grid': la rejilla se agrega en el servidor y llega de una vez
+HEATMAP_MODO = os.getenv('HEATMAP_MODE', 'stream')
+
+class BackendSQLServer:
+    """Consultas contra SQL Server. Cada método devuelve el resultado crudo de su consulta;
+    motor_local.MotorLocal implementa la misma interfaz sobre una instantánea local."""
+
+    def top10_metricas(self, inicio_dt, fin_dt, limite, desplazamiento):
+        sql = dedent("""
+        WITH Metrics AS (
+            SELECT
+                R.id_restaurant,
+                R.name_restaurant,
+                CAST(COUNT(O.id_order) AS INT) AS numPedido,
+                COUNT(DISTINCT AC.id_address) AS numClients,
+                CAST(AVG(CASE WHEN O.payment NOT IN (3,4) THEN (O.total + O.costo_envio) END) AS DECIMAL(10,2)) AS ticketAvg,
+                AVG(DATEDIFF(MINUTE, O.start_delivery_datetime, O.arrival_client_date)) AS deliveryTimeAvg,
+                AVG(DATEDIFF(MINUTE, O.order_acceptance_date, O.start_delivery_datetime)) AS deliveryWaitTimeAvg,
+                COUNT(CASE WHEN P.payment != 'Efectivo' AND O.payment NOT IN (3,7,4) THEN 1 END) AS ordersToCard,
+                COUNT(CASE WHEN P.payment = 'Efectivo' THEN 1 END) AS ordersToCash,
+                COUNT(CASE WHEN P.id_payment IN (3,7,4) THEN 1 END) AS ordersToTransference
+            FROM [dev_apprisa_delivery].[dbo].tbl_restaurants R
+            INNER JOIN [dev_apprisa_delivery].[dbo].tbl_orders O ON R.id_restaurant = O.restaurant
+            INNER JOIN [dev_apprisa_delivery].[dbo].ctl_payment P ON P.id_payment = O.payment
+            INNER JOIN [dev_apprisa_delivery].[dbo].tbl_address_client AC ON AC.id_address = O.id_address
+            WHERE O.order_completion_date BETWEEN ? AND ? AND O.[status] = 24
+            GROUP BY R.id_restaurant,R.name_restaurant
+        ),
+        Pagina AS (
+            SELECT *
+            FROM Metrics
+            ORDER BY numPedido DESC, id_restaurant
+            OFFSET ? ROWS FETCH NEXT ? ROWS ONLY
+        ),
+        OrdersByDay AS (
+            SELECT
+                R.id_restaurant,
+                DATENAME(WEEKDAY, O.order_completion_date) AS dia_semana,
+                COUNT(*) AS pedidos
+            FROM [dev_apprisa_delivery].[dbo].tbl_restaurants R
+            INNER JOIN [dev_apprisa_delivery].[dbo].tbl_orders O ON R.id_restaurant = O.restaurant
+            WHERE O.order_completion_date BETWEEN ? AND ? AND O.[status] = 24
+              AND O.restaurant IN (SELECT id_restaurant FROM Pagina)
+            GROUP BY R.id_restaurant, DATENAME(WEEKDAY, O.order_completion_date)
+        ),
+        Pivoted AS (
+            SELECT *
+            FROM OrdersByDay
+            PIVOT (SUM(pedidos) FOR dia_semana IN ([Monday],[Tuesday],[Wednesday],[Thursday],[Friday],[Saturday],[Sunday])) AS p
+        )
         SELECT
-            R.id_restaurant,
-            DATENAME(WEEKDAY, O.order_completion_date) AS dia_semana,
-            COUNT(*) AS pedidos
-        FROM [dev_apprisa_delivery].[dbo].tbl_restaurants R
-        INNER JOIN [dev_apprisa_delivery].[dbo].tbl_orders O ON R.id_restaurant = O.restaurant
-        WHERE O.order_completion_date BETWEEN '{inicio}' AND '{fin}' AND O.[status] = 24
-        GROUP BY R.id_restaurant, DATENAME(WEEKDAY, O.order_completion_date)
-    ),
-    Pivoted AS (
-        SELECT *
-        FROM OrdersByDay
-        PIVOT (SUM(pedidos) FOR dia_semana IN ([Monday],[Tuesday],[Wednesday],[Thursday],[Friday],[Saturday],[Sunday])) AS p
-    )
-    SELECT
-        M.id_restaurant,
-        M.name_restaurant,
-        M.numClients,
-        M.ticketAvg,
-        M.deliveryTimeAvg,
-        M.deliveryWaitTimeAvg,
-        M.ordersToCard,
-        M.ordersToCash,
-        M.ordersToTransference,
-        ISNULL(P.[Monday],0) AS [Monday],
-        ISNULL(P.[Tuesday],0) AS [Tuesday],
-        ISNULL(P.[Wednesday],0) AS [Wednesday],
-        ISNULL(P.[Thursday],0) AS [Thursday],
-        ISNULL(P.[Friday],0) AS [Friday],
-        ISNULL(P.[Saturday],0) AS [Saturday],
-        ISNULL(P.[Sunday],0) AS [Sunday]
-    FROM Metrics M
-    LEFT JOIN Pivoted P ON M.id_restaurant = P.id_restaurant
-    ORDER BY M.numPedido DESC;
-    """)
-    conn = conexion_bd()
-    df = pd.read_sql(sql, conn)
-    conn.close()
-    return df
+            M.id_restaurant,
+            M.name_restaurant,
+            M.numClients,
+            M.ticketAvg,
+            M.deliveryTimeAvg,
+            M.deliveryWaitTimeAvg,
+            M.ordersToCard,
+            M.ordersToCash,
+            M.ordersToTransference,
+            ISNULL(P.[Monday],0) AS [Monday],
+            ISNULL(P.[Tuesday],0) AS [Tuesday],
+            ISNULL(P.[Wednesday],0) AS [Wednesday],
+            ISNULL(P.[Thursday],0) AS [Thursday],
+            ISNULL(P.[Friday],0) AS [Friday],
+            ISNULL(P.[Saturday],0) AS [Saturday],
+            ISNULL(P.[Sunday],0) AS [Sunday]
+        FROM Pagina M
+        LEFT JOIN Pivoted P ON M.id_restaurant = P.id_restaurant
+        ORDER BY M.numPedido DESC, M.id_restaurant;
+        """)
+        conteos = ["id_restaurant","numClients","ordersToCard","ordersToCash","ordersToTransference","Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
+        tipos = {c: pa.int32() for c in conteos}
+        tipos.update({"deliveryTimeAvg": pa.float32(), "deliveryWaitTimeAvg": pa.float32()})
+        return leer_sql(sql, [inicio_dt, fin_dt, desplazamiento, limite, inicio_dt, fin_dt], tipos)
 
-@st.cache_data(show_spinner=False)
-def consulta_coordenadas_mes(id_restaurante, inicio_dt, fin_dt):
-    inicio = inicio_dt.strftime('%Y-%m-%d %H:%M:%S')
-    fin = fin_dt.strftime('%Y-%m-%d %H:%M:%S')
-    sql = dedent(f"""
+    SQL_COORDENADAS = dedent("""
         SELECT 
-            ISNULL(tac.latitude, ads.ad_latitude) AS lat,
-            ISNULL(tac.longitude, ads.ad_longitude) AS lon
+            TRY_CAST(ISNULL(tac.latitude, ads.ad_latitude) AS float) AS lat,
+            TRY_CAST(ISNULL(tac.longitude, ads.ad_longitude) AS float) AS lon
         FROM [dev_apprisa_delivery].[dbo].tbl_orders tbo
         LEFT JOIN [dev_apprisa_delivery].[dbo].tbl_address_client tac ON tac.id_address = tbo.id_address
         LEFT JOIN [dev_apprisa_delivery].[dbo].addresses ads ON tbo.addresses_id = ads.ad_id
         WHERE tbo.[status] = 24
-          AND tbo.restaurant = {id_restaurante}
-          AND tbo.order_completion_date BETWEEN '{inicio}' AND '{fin}'
-    """)
-    conn = conexion_bd()
-    df = pd.read_sql(sql, conn)
-    conn.close()
-    df["lat"] = pd.to_numeric(df["lat"], errors="coerce")
-    df["lon"] = pd.to_numeric(df["lon"], errors="coerce")
-    return df.dropna(subset=["lat","lon"])
-
-@st.cache_data(show_spinner=False)
-def consulta_pedidos_hora_mes(id_restaurante, inicio_dt, fin_dt):
-    inicio = inicio_dt.strftime('%Y-%m-%d %H:%M:%S')
-    fin = fin_dt.strftime('%Y-%m-%d %H:%M:%S')
-    sql = dedent(f"""
-        SELECT DATEPART(HOUR, O.order_completion_date) AS hora, COUNT(*) AS pedidos
-        FROM [dev_apprisa_delivery].[dbo].tbl_orders O
-        WHERE O.order_completion_date BETWEEN '{inicio}' AND '{fin}'
-          AND O.[status] = 24
-          AND O.restaurant = {id_restaurante}
-        GROUP BY DATEPART(HOUR, O.order_completion_date)
-        HAVING COUNT(*) > 0
-        ORDER BY hora
+          AND tbo.restaurant = ?
+          AND tbo.order_completion_date BETWEEN ? AND ?
     """)
-    conn = conexion_bd()
-    df = pd.read_sql(sql, conn)
-    conn.close()
-    return df
 
-@st.cache_data(show_spinner=False)
-def consulta_diaria_restaurante(id_restaurante, inicio_fecha, fin_fecha):
-    inicio = inicio_fecha.strftime('%Y-%m-%d')
-    fin = fin_fecha.strftime('%Y-%m-%d')
-    sql = dedent(f"""
-        SELECT 
-            CONVERT(date, o.order_completion_date) AS fecha,
-            COUNT(o.id_order) AS pedidos
-        FROM [dev_apprisa_delivery].[dbo].tbl_orders o
-        WHERE o.order_completion_date>'{inicio}' AND o.order_completion_date < '{fin}'
-          AND o.status = 24
-          AND o.restaurant = {id_restaurante}
-        GROUP BY CONVERT(date, o.order_completion_date)
-        ORDER BY fecha
-    """)
-    conn = conexion_bd()
-    df = pd.read_sql(sql, conn)
-    conn.close()
+    def coordenadas_lotes(self, id_restaurante, inicio_dt, fin_dt, lote):
+        return leer_sql_lotes(self.SQL_COORDENADAS, [id_restaurante, inicio_dt, fin_dt], {"lat": pa.float32(), "lon": pa.float32()}, lote)
+
+    def celdas_mes(self, id_restaurante, inicio_dt, fin_dt, resolucion, max_puntos):
+        sql = dedent("""
+            SELECT TOP (?) celda_lat, celda_lon, COUNT(*) AS peso
+            FROM (
+                SELECT
+                    FLOOR(TRY_CAST(ISNULL(tac.latitude, ads.ad_latitude) AS float) / ?) AS celda_lat,
+                    FLOOR(TRY_CAST(ISNULL(tac.longitude, ads.ad_longitude) AS float) / ?) AS celda_lon
+                FROM [dev_apprisa_delivery].[dbo].tbl_orders tbo
+                LEFT JOIN [dev_apprisa_delivery].[dbo].tbl_address_client tac ON tac.id_address = tbo.id_address
+                LEFT JOIN [dev_apprisa_delivery].[dbo].addresses ads ON tbo.addresses_id = ads.ad_id
+                WHERE tbo.[status] = 24
+                  AND tbo.restaurant = ?
+                  AND tbo.order_completion_date BETWEEN ? AND ?
+            ) c
+            WHERE celda_lat IS NOT NULL AND celda_lon IS NOT NULL
+            GROUP BY celda_lat, celda_lon
+            ORDER BY peso DESC
+        """)
+        return leer_sql(sql, [max_puntos, resolucion, resolucion, id_restaurante, inicio_dt, fin_dt], {"peso": pa.int32()})
+
+    def diaria_restaurantes(self, inicio_dt, fin_dt):
+        sql = dedent("""
+            SELECT
+                o.restaurant AS id_restaurant,
+                CONVERT(date, o.order_completion_date) AS fecha,
+                COUNT(*) AS pedidos
+            FROM [dev_apprisa_delivery].[dbo].tbl_orders o
+            WHERE o.[status] = 24
+              AND o.order_completion_date BETWEEN ? AND ?
+            GROUP BY o.restaurant, CONVERT(date, o.order_completion_date)
+        """)
+        return leer_sql(sql, [inicio_dt, fin_dt], {"id_restaurant": pa.int32(), "fecha": pa.date32(), "pedidos": pa.int32()})
+
+    def pedidos_restaurante(self, id_restaurante, desde, hasta):
+        sql = dedent("""
+            SELECT
+                tbo.order_completion_date AS fecha_hora,
+                tbo.costo_creditos AS creditos
+            FROM [dev_apprisa_delivery].[dbo].tbl_orders tbo
+            WHERE tbo.[status] = 24
+              AND tbo.restaurant = ?
+              AND tbo.order_completion_date BETWEEN ? AND ?
+        """)
+        return leer_sql(sql, [id_restaurante, desde, hasta], {"creditos": pa.float32()})
+
+    def pedidos_agregados(self, desde_excl, fin_dt):
+        sql = dedent("""
+            SELECT
+                O.restaurant AS id_restaurant,
+                CONVERT(date, O.order_completion_date) AS fecha,
+                DATEPART(HOUR, O.order_completion_date) AS hora,
+                COUNT(*) AS pedidos,
+                SUM(ISNULL(O.costo_creditos, 0)) AS creditos,
+                MAX(O.order_completion_date) AS ultima
+            FROM [dev_apprisa_delivery].[dbo].tbl_orders O
+            WHERE O.[status] = 24
+              AND O.order_completion_date > ?
+              AND O.order_completion_date <= ?
+            GROUP BY O.restaurant, CONVERT(date, O.order_completion_date), DATEPART(HOUR, O.order_completion_date)
+        """)
+        tipos = {"id_restaurant": pa.int32(), "fecha": pa.date32(), "hora": pa.int32(), "pedidos": pa.int32(), "creditos": pa.float64()}
+        return leer_sql(sql, [desde_excl, fin_dt], tipos)
+
+    def pedidos_franja(self, inicio_dt, fin_dt, minutos):
+        sql = dedent("""
+            SELECT id_restaurant, dia_semana, minuto, COUNT(*) AS pedidos
+            FROM (
+                SELECT
+                    O.restaurant AS id_restaurant,
+                    DATEDIFF(DAY, 0, O.order_completion_date) % 7 AS dia_semana,
+                    (DATEPART(HOUR, O.order_completion_date) * 60 + DATEPART(MINUTE, O.order_completion_date)) / ? * ? AS minuto
+                FROM [dev_apprisa_delivery].[dbo].tbl_orders O
+                WHERE O.[status] = 24 AND O.order_completion_date BETWEEN ? AND ?
+            ) f
+            GROUP BY id_restaurant, dia_semana, minuto
+        """)
+        tipos = {"id_restaurant": pa.int32(), "dia_semana": pa.int32(), "minuto": pa.int32(), "pedidos": pa.int32()}
+        return leer_sql(sql, [minutos, minutos, inicio_dt, fin_dt], tipos)
+
+# Backend de datos: 'sqlserver' (por defecto), 'local' (instantánea Parquet en SNAPSHOT_DIR,
+# ver sincronizar_snapshot.py) o 'auto' (SQL Server con la instantánea como respaldo).
+DATA_BACKEND = os.getenv('DATA_BACKEND', 'sqlserver')
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', '.snapshot')
+# Tras un fallo de SQL Server, segundos durante los que se va directo a la instantánea
+DB_RETRY_SECONDS = float(os.getenv('DB_RETRY_SECONDS', 60))
+
+@st.cache_resource(show_spinner=False, max_entries=1)
+def _motor_local(carpeta, version):
+    return MotorLocal.desde_parquet(carpeta)
+
+def motor_local():
+    """MotorLocal sobre la instantánea; se recarga cuando la sincronización la reescribe."""
+    return _motor_local(SNAPSHOT_DIR, os.path.getmtime(os.path.join(SNAPSHOT_DIR, "tbl_orders.parquet")))
+
+def hay_snapshot():
+    return os.path.exists(os.path.join(SNAPSHOT_DIR, "tbl_orders.parquet"))
+
+@st.cache_resource(show_spinner=False)
+def _caida_principal():
+    """Estado compartido del backend principal: hasta cuándo (time.monotonic) se evita."""
+    return {"hasta": 0.0}
+
+class BackendConRespaldo:
+    """Delega en el backend principal y, si este falla o excede el tiempo de consulta,
+    repite la llamada sobre el de respaldo. Tras un fallo, las llamadas de los siguientes
+    DB_RETRY_SECONDS van directas al respaldo sin esperar otra vez al principal. Si
+    `disponible()` indica que no hay respaldo, se propaga el error del principal."""
+
+    def __init__(self, principal, respaldo, disponible):
+        self._principal = principal
+        self._respaldo = respaldo
+        self._disponible = disponible
+
+    def __getattr__(self, nombre):
+        metodo = getattr(self._principal, nombre)
+
+        @functools.wraps(metodo)
+        def envoltura(*args):
+            caida = _caida_principal()
+            if caida["hasta"] <= time.monotonic() or not self._disponible():
+                try:
+                    return metodo(*args)
+                except (pyodbc.Error, TimeoutError):
+                    if not self._disponible():
+                        raise
+                    caida["hasta"] = time.monotonic() + DB_RETRY_SECONDS
+            medicion = _medicion_actual.get()
+            if medicion is not None:
+                medicion["respaldo"] = True
+            return getattr(self._respaldo(), nombre)(*args)
+        return envoltura
+
+def backend():
+    if DATA_BACKEND == "local":
+        return motor_local()
+    if DATA_BACKEND == "auto":
+        return BackendConRespaldo(BackendSQLServer(), motor_local, hay_snapshot)
+    return BackendSQLServer()
+
+@cache_consulta()
+def consulta_top10_metricas(inicio_dt, fin_dt, limite=TOP_N, desplazamiento=0):
+    return backend().top10_metricas(inicio_dt, fin_dt, int(limite), int(desplazamiento))
+
+@cache_consulta()
+def consulta_celdas_mes(id_restaurante, inicio_dt, fin_dt, resolucion=HEATMAP_RESOLUCION, max_puntos=HEATMAP_MAX_PUNTOS):
+    """Coordenadas de clientes agregadas en el servidor en una rejilla de `resolucion` grados,
+    devolviendo como máximo `max_puntos` celdas (las de más pedidos)."""
+    df = backend().celdas_mes(int(id_restaurante), inicio_dt, fin_dt, resolucion, int(max_puntos))
+    return pd.DataFrame({
+        "lat": ((df["celda_lat"] + 0.5) * resolucion).astype(np.float32),
+        "lon": ((df["celda_lon"] + 0.5) * resolucion).astype(np.float32),
+        "peso": df["peso"],
+    })
+
+@cache_consulta()
+def consulta_detalle_restaurante(id_restaurante, inicio_mes, fin_mes):
+    """Trae en una sola consulta los pedidos completados del restaurante en el mes
+    seleccionado y el anterior, y deriva localmente pedidos por hora y resúmenes de
+    ambos meses. La serie diaria del año sale de matriz_diaria() y las coordenadas del
+    mapa de celdas_mapa()."""
+    inicio_ant, fin_ant = limites_mes(*(inicio_mes - relativedelta(months=1)).timetuple()[:2])
+    df = backend().pedidos_restaurante(int(id_restaurante), inicio_ant, fin_mes)
+    df["creditos"] = df["creditos"].fillna(0)
+    return {
+        "horas": _pedidos_hora_locales(df, inicio_mes, fin_mes),
+        "resumen_mes": _resumen_local(df, inicio_mes, fin_mes),
+        "resumen_ant": _resumen_local(df, inicio_ant, fin_ant),
+    }
+
+def _filtrar_periodo(df, inicio, fin):
+    return df[(df["fecha_hora"] >= pd.Timestamp(inicio)) & (df["fecha_hora"] <= pd.Timestamp(fin))]
+
+def _pedidos_hora_locales(df, inicio, fin):
+    horas = _filtrar_periodo(df, inicio, fin)["fecha_hora"].dt.hour
+    return horas.value_counts().sort_index().rename_axis("hora").reset_index(name="pedidos")
+
+def _resumen_local(df, inicio, fin):
+    periodo = _filtrar_periodo(df, inicio, fin)
+    return int(len(periodo)), int(periodo["fecha_hora"].dt.normalize().nunique()), float(periodo["creditos"].sum())
+
+# Aviso opcional de avance para consulta_celdas_flujo; recibe el acumulador tras cada lote
+_avance_celdas = contextvars.ContextVar("avance_celdas", default=None)
+
+@cache_consulta()
+def consulta_celdas_flujo(id_restaurante, inicio_dt, fin_dt):
+    """Coordenadas de clientes leídas por lotes de HEATMAP_STREAM_BATCH filas y plegadas
+    en un AcumuladorCeldas; nunca se tiene el periodo completo en memoria."""
+    acumulador = AcumuladorCeldas(HEATMAP_RESOLUCION)
+    avance = _avance_celdas.get()
+    with closing(backend().coordenadas_lotes(int(id_restaurante), inicio_dt, fin_dt, HEATMAP_LOTE)) as lotes:
+        for lote in lotes:
+            acumulador.agregar(lote["lat"], lote["lon"])
+            if avance is not None:
+                avance(acumulador)
+    return acumulador
+
+def _fin_anio(anio):
+    return datetime(anio, 12, 31, 23, 59, 59)
+
+@cache_consulta(fin_periodo=_fin_anio)
+def consulta_matriz_diaria(anio):
+    """Una sola consulta por año con los pedidos diarios de todos los restaurantes."""
+    return MatrizDiaria(anio, backend().diaria_restaurantes(datetime(anio, 1, 1), _fin_anio(anio)))
+
+# Almacén local de agregados (Parquet). Los meses cerrados se escriben una sola vez;
+# el mes en curso se actualiza de forma incremental desde la última marca de agua.
+ROLLUP_DIR = os.getenv('ROLLUP_DIR', '.rollups')
+ROLLUP_REFRESH_SECONDS = float(os.getenv('ROLLUP_REFRESH_SECONDS', 300))
+# Cada actualización vuelve a consultar las ROLLUP_SOLAPAMIENTO horas previas a la marca
+# de agua y reemplaza sus grupos.
+COLUMNAS_ROLLUP = ["id_restaurant", "fecha", "hora", "pedidos", "creditos"]
+
+@st.cache_resource(show_spinner=False)
+def _candado_rollup(ruta):
+    return threading.Lock()
+
+def _ruta_rollup(tipo, anio, mes):
+    return os.path.join(ROLLUP_DIR, DATA_BACKEND, f"{tipo}_{anio:04d}-{mes:02d}.parquet")
+
+def _leer_meta_rollup(ruta):
+    if not os.path.exists(ruta):
+        return None
+    meta = pq.read_schema(ruta).metadata or {}
+    return {k.decode(): v.decode() for k, v in meta.items()}
+
+def _escribir_rollup(ruta, df, meta):
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    tabla = tabla.replace_schema_metadata({**(tabla.schema.metadata or {}), **{k: str(v) for k, v in meta.items()}})
+    temporal = f"{ruta}.{os.getpid()}.{threading.get_ident()}.tmp"
+    pq.write_table(tabla, temporal)
+    os.replace(temporal, ruta)
+
+@instrumentada
+def consulta_pedidos_agregados(desde_excl, fin_dt):
+    """Pedidos completados por restaurante, día y hora con order_completion_date en (desde_excl, fin_dt]."""
+    df = backend().pedidos_agregados(desde_excl, fin_dt)
+    ultima = df["ultima"].max() if not df.empty else None
+    df = df[COLUMNAS_ROLLUP].copy()
+    return df, ultima
+
+def rollup_pedidos(anio, mes):
+    """Pedidos por restaurante×día×hora del mes, servidos desde el almacén Parquet. Lo que
+    llega de la instantánea de respaldo se devuelve sin guardarlo en el almacén."""
+    inicio, fin = limites_mes(anio, mes)
+    if inicio > datetime.now():
+        return pd.DataFrame(columns=COLUMNAS_ROLLUP)
+    ruta = _ruta_rollup("pedidos", anio, mes)
+    with _candado_rollup(ruta), medir_consulta("rollup_pedidos") as medicion:
+        meta = _leer_meta_rollup(ruta)
+        if meta is not None and (meta.get("cerrado") == "1" or time.time() - float(meta["actualizado"]) < ROLLUP_REFRESH_SECONDS):
+            return pd.read_parquet(ruta)
+        # El mes solo se congela cuando ya no caben pedidos tardíos dentro del solapamiento
+        cerrado = periodo_cerrado(fin)
+        if meta is None:
+            base = None
+            marca = inicio - timedelta(microseconds=1)
+            corte = inicio
+        else:
+            base = pd.read_parquet(ruta)
+            marca = datetime.fromisoformat(meta["marca_agua"])
+            # Corte en hora exacta: los grupos restaurante×día×hora desde el corte se reemplazan completos
+            corte = max(inicio, (marca - ROLLUP_SOLAPAMIENTO).replace(minute=0, second=0, microsecond=0))
+        nuevos, ultima = consulta_pedidos_agregados(corte - timedelta(microseconds=1), fin)
+        if base is None:
+            df = nuevos
+        else:
+            hora_base = pd.to_datetime(base["fecha"]) + pd.to_timedelta(base["hora"].astype(int), unit="h")
+            df = pd.concat([base[(hora_base < pd.Timestamp(corte)).to_numpy()], nuevos], ignore_index=True)
+        if medicion.get("respaldo"):
+            return df
+        if ultima is not None:
+            marca = max(marca, ultima.to_pydatetime())
+        _escribir_rollup(ruta, df, {"marca_agua": marca.isoformat(), "cerrado": int(cerrado), "actualizado": time.time()})
+        return df
+
+def rollup_top10(inicio_dt, fin_dt, limite=TOP_N, desplazamiento=0):
+    """Métricas del top N; los meses cerrados se leen del almacén Parquet. Un mes no se
+    escribe hasta que termina su solapamiento: antes aún recibe pedidos tardíos."""
+    if not periodo_cerrado(fin_dt):
+        return consulta_top10_metricas(inicio_dt, fin_dt, limite, desplazamiento)
+    ruta = _ruta_rollup(f"top{limite}+{desplazamiento}", inicio_dt.year, inicio_dt.month)
+    if os.path.exists(ruta):
+        return pd.read_parquet(ruta)
+    with medir_consulta("rollup_top10") as medicion:
+        df = consulta_top10_metricas(inicio_dt, fin_dt, limite, desplazamiento)
+    if not medicion.get("respaldo"):
+        with _candado_rollup(ruta):
+            _escribir_rollup(ruta, df, {"cerrado": 1, "actualizado": time.time()})
     return df
 
-@st.cache_data(show_spinner=False)
-def consulta_resumen_mes(id_restaurante, inicio_dt, fin_dt):
-    inicio = inicio_dt.strftime('%Y-%m-%d %H:%M:%S')
-    fin = fin_dt.strftime('%Y-%m-%d %H:%M:%S')
-    sql = dedent(f"""
-        SELECT 
-            COUNT(*) AS pedidos,
-            COUNT(DISTINCT CONVERT(date, order_completion_date)) AS dias_activos,
-            SUM(costo_credits) AS creditos
-        FROM [dev_apprisa_delivery].[dbo].tbl_orders
-        WHERE [status]=24 AND restaurant={id_restaurante}
-          AND order_completion_date BETWEEN '{inicio}' AND '{fin}'
-    """).replace("costo_credits","costo_creditos")
-    conn = conexion_bd()
-    df = pd.read_sql(sql, conn)
-    conn.close()
-    return int(df.iloc[0]["pedidos"]), int(df.iloc[0]["dias_activos"]), float(df.iloc[0]["creditos"] if df.iloc[0]["creditos"] is not None else 0)
+@cache_consulta()
+def detalle_desde_rollups(id_restaurante, inicio_mes, fin_mes):
+    """Mismo resultado que consulta_detalle_restaurante, leyendo los agregados del almacén.
+    Los meses se leen en el hilo que llama: la precarga no ocupa el ejecutor de consultas."""
+    inicio_ant, fin_ant = limites_mes(*(inicio_mes - relativedelta(months=1)).timetuple()[:2])
+    partes = [rollup_pedidos(inicio_ant.year, inicio_ant.month), rollup_pedidos(inicio_mes.year, inicio_mes.month)]
+    df = pd.concat(partes, ignore_index=True)
+    df = df[df["id_restaurant"] == id_restaurante]
+    df = df.assign(fecha_hora=pd.to_datetime(df["fecha"]) + pd.to_timedelta(df["hora"].astype(int), unit="h"))
+
+    def resumen(inicio, fin):
+        periodo = _filtrar_periodo(df, inicio, fin)
+        return int(periodo["pedidos"].sum()), int(periodo["fecha"].nunique()), float(periodo["creditos"].sum())
+
+    del_mes = _filtrar_periodo(df, inicio_mes, fin_mes)
+    return {
+        "horas": del_mes.groupby("hora", as_index=False)["pedidos"].sum().astype({"hora": int, "pedidos": int}),
+        "resumen_mes": resumen(inicio_mes, fin_mes),
+        "resumen_ant": resumen(inicio_ant, fin_ant),
+    }
+
+def detalle_restaurante(id_restaurante, inicio_mes, fin_mes):
+    if ROLLUP_DIR:
+        return detalle_desde_rollups(id_restaurante, inicio_mes, fin_mes)
+    return consulta_detalle_restaurante(id_restaurante, inicio_mes, fin_mes)
+
+def celdas_mapa(id_restaurante, inicio_dt, fin_dt):
+    """Celdas del mapa de calor y su centro. Con HEATMAP_MODE=grid la rejilla se calcula
+    en el servidor; si no, se pliega en flujo con consulta_celdas_flujo."""
+    if HEATMAP_MODO == "grid":
+        return consulta_celdas_mes(id_restaurante, inicio_dt, fin_dt), None
+    acumulador = consulta_celdas_flujo(id_restaurante, inicio_dt, fin_dt)
+    return acumulador.celdas(HEATMAP_MAX_PUNTOS), acumulador.centro
+
+@cache_consulta(fin_periodo=_fin_anio)
+def matriz_desde_rollups(anio):
+    """MatrizDiaria del año armada con los agregados por hora del almacén. Se ejecuta como
+    tarea de ejecutor_consultas(), así que los meses se leen en ese mismo hilo."""
+    partes = [rollup_pedidos(anio, mes) for mes in range(1, 13)]
+    df = pd.concat(partes, ignore_index=True)
+    return MatrizDiaria(anio, df.groupby(["id_restaurant","fecha"], as_index=False)["pedidos"].sum())
+
+def matriz_diaria(anio):
+    if ROLLUP_DIR:
+        return matriz_desde_rollups(anio)
+    return consulta_matriz_diaria(anio)
+
+# Las consultas independientes de una página corren en paralelo; la precarga del resto
+# del top usa su propio ejecutor para no bloquear las consultas de primer plano.
+CONSULTAS_PARALELAS = int(os.getenv('QUERY_WORKERS', 4))
+PRECARGA_PARALELA = int(os.getenv('PREFETCH_WORKERS', 2))
+
+@st.cache_resource(show_spinner=False)
+def ejecutor_consultas():
+    return ThreadPoolExecutor(max_workers=CONSULTAS_PARALELAS, thread_name_prefix="consultas")
+
+@st.cache_resource(show_spinner=False)
+def ejecutor_precarga():
+    return ThreadPoolExecutor(max_workers=PRECARGA_PARALELA, thread_name_prefix="precarga")
+
+def precargar_detalles(ids_restaurantes, inicio_mes, fin_mes):
+    """Calienta en segundo plano el detalle de los restaurantes indicados. Una precarga
+    anterior de la sesión para otro mes se cancela."""
+    clave = (inicio_mes, fin_mes, tuple(ids_restaurantes))
+    previa = st.session_state.get("precarga")
+    if previa is not None:
+        if previa["clave"] == clave:
+            return
+        previa["cancelada"].set()
+        for futuro in previa["futuros"]:
+            futuro.cancel()
+    cancelada = threading.Event()
+
+    def tarea(id_restaurante):
+        if not cancelada.is_set():
+            detalle_restaurante(id_restaurante, inicio_mes, fin_mes)
+
+    ejecutor = ejecutor_precarga()
+    futuros = [ejecutor.submit(tarea, id_restaurante) for id_restaurante in ids_restaurantes]
+    st.session_state["precarga"] = {"clave": clave, "cancelada": cancelada, "futuros": futuros}
 
 def grafico_dias_semana_es(fila):
     mapa = {"Monday":"Lunes","Tuesday":"Martes","Wednesday":"Miércoles","Thursday":"Jueves","Friday":"Viernes","Saturday":"Sábado","Sunday":"Domingo"}
@@ -245,8 +1246,12 @@ def tabla_top10(df):
     dias = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
     df2 = df.copy()
     df2["Pedidos Mes"] = df2[dias].sum(axis=1)
-    df2 = df2[["name_restaurant","Pedidos Mes","ticketAvg","deliveryTimeAvg","deliveryWaitTimeAvg","ordersToCard","ordersToCash","ordersToTransference"]]
+    columnas = ["name_restaurant","Pedidos Mes","ticketAvg","deliveryTimeAvg","deliveryWaitTimeAvg","ordersToCard","ordersToCash","ordersToTransference"]
+    if "ventanaPico" in df2:
+        columnas.append("ventanaPico")
+    df2 = df2[columnas]
     df2 = df2.rename(columns={
+        "ventanaPico":"Ventana Pico (80%)",
         "name_restaurant":"Establecimiento",
         "ticketAvg":"Ticket Promedio",
         "deliveryTimeAvg":"Tiempo Delivery (min)",
@@ -257,53 +1262,146 @@ def tabla_top10(df):
     })
     return df2
 
-def mapa_calor(df_coords):
+def mapa_calor(df_coords, centro=None):
     if df_coords.empty:
         return None
-    m = folium.Map(location=[df_coords["lat"].mean(), df_coords["lon"].mean()], zoom_start=12, tiles="OpenStreetMap", control_scale=True)
-    HeatMap(data=df_coords[["lat","lon"]].values, radius=15, blur=10, max_zoom=13).add_to(m)
+    if "peso" in df_coords:
+        pesos = df_coords["peso"]
+        if centro is None:
+            centro = [np.average(df_coords["lat"], weights=pesos), np.average(df_coords["lon"], weights=pesos)]
+        datos = np.column_stack([df_coords["lat"], df_coords["lon"], pesos / pesos.max()])
+    else:
+        if centro is None:
+            centro = [df_coords["lat"].mean(), df_coords["lon"].mean()]
+        datos = df_coords[["lat","lon"]].values
+    m = folium.Map(location=centro, zoom_start=12, tiles="OpenStreetMap", control_scale=True)
+    HeatMap(data=datos, radius=15, blur=10, max_zoom=13).add_to(m)
     Fullscreen().add_to(m)
     return m
 
-def tabla_y_grafico_mensual(df_diario):
-    if df_diario.empty:
+def tabla_y_grafico_mensual(df_mensual):
+    if df_mensual.empty:
         return None, None
-    df = df_diario.copy()
-    df["fecha"] = pd.to_datetime(df["fecha"])
-    dfm = df.groupby(pd.Grouper(key="fecha", freq="M"))["pedidos"].sum().reset_index()
+    dfm = df_mensual.rename(columns={"pedidos":"Pedidos", "variacion":"Variación %"})
     dfm["Mes"] = dfm["fecha"].dt.month.map(MESES_ES) + " " + dfm["fecha"].dt.year.astype(str)
-    dfm["Variación %"] = dfm["pedidos"].pct_change().replace([np.inf,-np.inf], np.nan)*100
-    dfm = dfm.rename(columns={"pedidos":"Pedidos"})
     fig = px.bar(dfm.sort_values("fecha"), x="Mes", y="Pedidos", title="Pedidos por mes y variación", text="Pedidos")
     fig.update_traces(textposition="outside")
     return dfm[["Mes","Pedidos","Variación %"]], fig
 
-def ventana_pico_horaria(df_horas, cobertura=0.8):
+def ventanas_pico(conteos, cobertura=0.8, circular=False):
+    """Ventana contigua más corta que cubre `cobertura` del total en cada serie de `conteos`
+    (la última dimensión son las franjas). Con circular=True la ventana puede cruzar el
+    final de la serie (p. ej. la medianoche). Devuelve arrays (inicio, ancho, suma, total)
+    con la forma de las dimensiones previas; ancho es 0 en series sin pedidos."""
+    conteos = np.asarray(conteos, dtype=np.int64)
+    forma = conteos.shape[:-1]
+    b = conteos.shape[-1]
+    conteos = conteos.reshape(-1, b)
+    n = conteos.shape[0]
+    total = conteos.sum(axis=1)
+    objetivo = total * cobertura
+    serie = np.concatenate([conteos, conteos], axis=1) if circular else conteos
+    acumulado = np.zeros((n, serie.shape[1] + 1), dtype=np.int64)
+    np.cumsum(serie, axis=1, out=acumulado[:, 1:])
+    inicios = np.arange(b)
+
+    def sumas(anchos):
+        fin = inicios[None, :] + anchos[:, None]
+        validas = fin < acumulado.shape[1]
+        fin = np.minimum(fin, acumulado.shape[1] - 1)
+        return np.where(validas, np.take_along_axis(acumulado, fin, axis=1) - acumulado[:, :b], -1)
+
+    # La suma máxima de ventana crece con el ancho: búsqueda binaria del ancho mínimo, por serie
+    bajo = np.ones(n, dtype=np.int64)
+    alto = np.full(n, b, dtype=np.int64)
+    while np.any(bajo < alto):
+        medio = (bajo + alto) // 2
+        alcanza = sumas(medio).max(axis=1) >= objetivo
+        abierto = bajo < alto
+        alto = np.where(abierto & alcanza, medio, alto)
+        bajo = np.where(abierto & ~alcanza, medio + 1, bajo)
+    finales = sumas(bajo)
+    inicio = finales.argmax(axis=1)
+    suma = finales[np.arange(n), inicio]
+    ancho = np.where(total > 0, bajo, 0)
+    return inicio.reshape(forma), ancho.reshape(forma), suma.reshape(forma), total.reshape(forma)
+
+def matriz_franjas(df, minutos=60, por_dia_semana=False):
+    """Matriz densa de pedidos a partir de filas id_restaurant, dia_semana (0 = lunes),
+    minuto (inicio de la franja en minutos desde medianoche) y pedidos. Devuelve
+    (ids, matriz) con forma restaurante × franja, o restaurante × día × franja."""
+    ids, fila = np.unique(df["id_restaurant"].to_numpy(), return_inverse=True)
+    franjas = 24 * 60 // minutos
+    franja = df["minuto"].to_numpy(dtype=np.int64) // minutos
+    pedidos = df["pedidos"].to_numpy(dtype=np.int64)
+    if por_dia_semana:
+        matriz = np.zeros((len(ids), 7, franjas), dtype=np.int64)
+        np.add.at(matriz, (fila.ravel(), df["dia_semana"].to_numpy(dtype=np.int64), franja), pedidos)
+    else:
+        matriz = np.zeros((len(ids), franjas), dtype=np.int64)
+        np.add.at(matriz, (fila.ravel(), franja), pedidos)
+    return ids, matriz
+
+def franjas_desde_rollup(df_rollup):
+    return pd.DataFrame({
+        "id_restaurant": df_rollup["id_restaurant"].to_numpy(),
+        "dia_semana": pd.to_datetime(df_rollup["fecha"]).dt.dayofweek.to_numpy(),
+        "minuto": df_rollup["hora"].astype(int).to_numpy() * 60,
+        "pedidos": df_rollup["pedidos"].to_numpy(),
+    })
+
+@cache_consulta()
+def consulta_pedidos_franja(inicio_dt, fin_dt, minutos=15):
+    """Pedidos completados de todos los restaurantes por día de la semana y franja de `minutos`."""
+    return backend().pedidos_franja(inicio_dt, fin_dt, int(minutos))
+
+# Ancho de las franjas de la ventana pico; debe dividir una hora
+PICO_MINUTOS = int(os.getenv('PEAK_SLOT_MINUTES', 60))
+# Con 1 la ventana pico puede cruzar la medianoche (p. ej. 22:00 - 01:00)
+PICO_CIRCULAR = os.getenv('PEAK_WRAP_MIDNIGHT') == '1'
+
+def franjas_mes(anio, mes, minutos=PICO_MINUTOS):
+    """Pedidos del mes por restaurante y franja. Las franjas de una hora salen del almacén
+    de agregados si está activo; las demás, de consulta_pedidos_franja."""
+    if ROLLUP_DIR and minutos == 60:
+        return franjas_desde_rollup(rollup_pedidos(anio, mes))
+    inicio, fin = limites_mes(anio, mes)
+    return consulta_pedidos_franja(inicio, fin, minutos)
+
+def ventanas_pico_restaurantes(df_franjas, cobertura=0.8, minutos=60, circular=False, por_dia_semana=False):
+    """Ventana pico de todos los restaurantes de `df_franjas` en una sola pasada, o de cada
+    restaurante y día de la semana (columna dia_semana) con por_dia_semana=True. Como en
+    ventana_pico_horaria, el fin mostrado es el inicio de la última franja incluida."""
+    columnas = ["id_restaurant","dia_semana","ventanaPico"] if por_dia_semana else ["id_restaurant","ventanaPico"]
+    if df_franjas.empty:
+        return pd.DataFrame(columns=columnas)
+    ids, matriz = matriz_franjas(df_franjas, minutos, por_dia_semana)
+    inicio, ancho, suma, total = (a.ravel() for a in ventanas_pico(matriz, cobertura, circular))
+    fin = (inicio + ancho - 1) % matriz.shape[-1]
+
+    def hhmm(franja):
+        return f"{franja * minutos // 60:02d}:{franja * minutos % 60:02d}"
+
+    texto = [f"{hhmm(i)} - {hhmm(f)} ({100 * s / t:.0f}%)" if t > 0 else None for i, f, s, t in zip(inicio, fin, suma, total)]
+    if por_dia_semana:
+        return pd.DataFrame({"id_restaurant": np.repeat(ids, 7), "dia_semana": np.tile(np.arange(7), len(ids)), "ventanaPico": texto})
+    return pd.DataFrame({"id_restaurant": ids, "ventanaPico": texto})
+
+def ventana_pico_horaria(df_horas, cobertura=0.8, circular=False):
     if df_horas.empty:
         return None
-    base = pd.DataFrame({"hora": list(range(24))}).merge(df_horas, on="hora", how="left").fillna({"pedidos":0})
-    total = int(base["pedidos"].sum())
+    conteos = np.zeros(24, dtype=np.int64)
+    horas = df_horas["hora"].astype(int).to_numpy()
+    validas = (horas >= 0) & (horas < 24)
+    np.add.at(conteos, horas[validas], df_horas["pedidos"].fillna(0).astype(int).to_numpy()[validas])
+    inicio, ancho, suma, total = ventanas_pico(conteos, cobertura, circular)
     if total == 0:
         return None
-    objetivo = total * cobertura
-    mejor_inicio = 0
-    mejor_fin = 23
-    mejor_ancho = 24
-    mejor_suma = 0
-    for ancho in range(1,25):
-        for inicio in range(0,24-ancho+1):
-            fin = inicio + ancho - 1
-            suma = int(base.loc[(base["hora"]>=inicio)&(base["hora"]<=fin),"pedidos"].sum())
-            if suma >= objetivo:
-                if ancho < mejor_ancho or (ancho == mejor_ancho and suma > mejor_suma):
-                    mejor_inicio, mejor_fin, mejor_ancho, mejor_suma = inicio, fin, ancho, suma
-        if mejor_suma >= objetivo:
-            break
-    porcentaje = 100 * mejor_suma / total
-    return mejor_inicio, mejor_fin, porcentaje, total
-
-def analisis_textual(df_horas, df_diario_mes, titulo_mes):
-    vm = ventana_pico_horaria(df_horas, 0.8)
+    porcentaje = 100 * float(suma) / float(total)
+    return int(inicio), int((inicio + ancho - 1) % 24), porcentaje, int(total)
+
+def analisis_textual(df_horas, df_semanal, titulo_mes):
+    vm = ventana_pico_horaria(df_horas, 0.8, PICO_CIRCULAR)
     if vm is None:
         texto_picos = f"**Patrones Diarios ({titulo_mes})**\n\n- Sin datos suficientes para calcular picos"
     else:
@@ -311,12 +1409,10 @@ def analisis_textual(df_horas, df_diario_mes, titulo_mes):
         hora_pico = int(df_horas.loc[df_horas["pedidos"].idxmax(),"hora"]) if not df_horas.empty else 0
         pedidos_pico = int(df_horas["pedidos"].max()) if not df_horas.empty else 0
         texto_picos = f"**Patrones Diarios ({titulo_mes})**\n\n- Pico de Actividad: {hi:02d}:00 - {hf:02d}:00 (Representa el {porc:.0f}% de pedidos del día)\n- Hora Pico Absoluta: {hora_pico:02d}:00 ({pedidos_pico} pedidos)"
-    if df_diario_mes.empty:
+    if df_semanal.empty:
         texto_semana = "**Evolución Semanal**\n\n- Sin datos"
     else:
-        df = df_diario_mes.copy()
-        df["semana"] = df["fecha"].dt.isocalendar().week
-        sem = df.groupby("semana")["pedidos"].sum().reset_index().sort_values("semana")
+        sem = df_semanal.sort_values("semana").reset_index(drop=True)
         semana_max = int(sem.loc[sem["pedidos"].idxmax(),"semana"])
         pedidos_max = int(sem["pedidos"].max())
         tendencia = "Estable"
@@ -329,101 +1425,219 @@ def analisis_textual(df_horas, df_diario_mes, titulo_mes):
         texto_semana = f"**Evolución Semanal**\n\n- Semana más Fuerte: Semana {semana_max} ({pedidos_max} pedidos)\n- Tendencia General: {tendencia}"
     return texto_picos, texto_semana
 
+def panel_administracion():
+    with st.expander("Administración"):
+        st.caption("Caché de consultas")
+        st.json(cache_consultas().estadisticas())
+        if cache_compartida() is not None:
+            st.caption("Caché compartida entre procesos")
+            st.json(cache_compartida().estadisticas())
+        st.caption("Pool de conexiones")
+        st.json(pool_conexiones().estadisticas())
+        eventos = pd.DataFrame(metricas().eventos())
+        if eventos.empty:
+            return
+        consultas = eventos[eventos["tipo"] == "consulta"]
+        if not consultas.empty:
+            st.caption("Consultas")
+            st.dataframe(consultas.groupby("consulta").agg(
+                llamadas=("total_ms", "size"),
+                aciertos=("cache", lambda c: int((c == "hit").sum())),
+                compartidos=("cache", lambda c: int(c.isin(["compartida", "espera"]).sum())),
+                ms_medio=("total_ms", "mean"),
+                ms_max=("total_ms", "max"),
+                conexion_ms=("conexion_ms", "mean"),
+                ejecucion_ms=("ejecucion_ms", "mean"),
+                lectura_ms=("lectura_ms", "mean"),
+                filas=("filas", "sum"),
+                mb=("bytes", lambda b: round(b.sum() / 2**20, 2)),
+            ).sort_values("ms_medio", ascending=False).round(1), use_container_width=True)
+        secciones = eventos[eventos["tipo"] == "render"]
+        if not secciones.empty:
+            st.caption("Secciones")
+            st.dataframe(secciones.groupby("seccion")["total_ms"].agg(["count", "mean", "max"]).round(1), use_container_width=True)
+        st.caption("Últimos eventos")
+        st.dataframe(eventos.iloc[::-1].head(50), hide_index=True, use_container_width=True)
+
+@st.fragment
+def seccion_top(df_top, titulo, clave_paginas, paginas):
+    """Ranking del mes. Es un fragmento: las interacciones del detalle no lo vuelven a
+    construir; "Mostrar más" sí relanza la app porque cambia el top que usa el detalle."""
+    with medir_seccion("top"):
+        c1, c2 = st.columns([1.2,1])
+        with c1:
+            st.subheader(f"Top {len(df_top)} • {titulo}")
+            st.dataframe(tabla_top10(df_top), hide_index=True, use_container_width=True)
+            if len(df_top) == paginas*TOP_N and st.button("Mostrar más"):
+                st.session_state[clave_paginas] = paginas + 1
+                st.rerun(scope="app")
+        with c2:
+            cols_dias = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
+            df_barras = df_top.assign(**{"Pedidos Mes": df_top[cols_dias].sum(axis=1)})
+            fig_top = px.bar(df_barras.sort_values("Pedidos Mes", ascending=False), x="name_restaurant", y="Pedidos Mes", title=f"Top {len(df_top)}")
+            fig_top.update_layout(xaxis_title="Establecimiento", yaxis_title="Pedidos")
+            st.plotly_chart(fig_top, use_container_width=True)
+
+@st.fragment
+def seccion_mapa(id_restaurante, inicio_mes, fin_mes, titulo, clave):
+    """Mapa de calor bajo demanda: el mapa de folium solo se construye y se envía al
+    navegador mientras el interruptor está activo, y activarlo no relanza el detalle.
+    Si la lectura de coordenadas tarda, se muestra un avance cada HEATMAP_PROGRESS_SECONDS."""
+    st.subheader(f"Mapa de Calor de Clientes • {titulo}")
+    if not st.toggle("Mostrar mapa de calor", key=f"ver_{clave}"):
+        return
+    marco = st.empty()
+    ultimo = [time.perf_counter()]
+
+    def avance(acumulador):
+        if time.perf_counter() - ultimo[0] < HEATMAP_PROGRESO:
+            return
+        with marco.container():
+            st.caption(f"Leyendo ubicaciones… {acumulador.n:,} pedidos")
+            components.html(mapa_calor(acumulador.celdas(HEATMAP_MAX_PUNTOS), acumulador.centro).get_root().render(), height=500)
+        ultimo[0] = time.perf_counter()
+
+    # El interruptor solo relanza este fragmento: sus tiempos se miden aquí
+    with medir_seccion("mapa_celdas"):
+        token = _avance_celdas.set(avance)
+        try:
+            celdas, centro = celdas_mapa(id_restaurante, inicio_mes, fin_mes)
+        finally:
+            _avance_celdas.reset(token)
+    with medir_seccion("mapa_folium"):
+        mapa = mapa_calor(celdas, centro)
+        with marco.container():
+            if mapa is None:
+                st.warning("Sin datos de ubicación para el mes seleccionado.")
+            else:
+                st_folium(mapa, width=1200, height=500, key=clave)
+
+@st.fragment
+def seccion_detalle(df_top, anio_sel, mes_num, inicio_mes, fin_mes, picos_semana=None):
+    """Detalle del establecimiento elegido. Es un fragmento: cambiar de establecimiento
+    solo vuelve a ejecutar esta sección."""
+    mes_sel = MESES_ES[mes_num]
+    # Clave y etiqueta fijas por mes. "Mostrar más" cambia las opciones y con ellas la
+    # identidad del widget, que pierde su estado: la selección se guarda aparte y fija
+    # el índice inicial
+    nombres = dict(zip(df_top["id_restaurant"].astype(int).tolist(), df_top["name_restaurant"]))
+    clave = f"establecimiento_{anio_sel}_{mes_num}"
+    ids = list(nombres)
+    previo = st.session_state.get(f"{clave}_id")
+    id_sel = st.selectbox("Establecimiento del Top", ids, index=ids.index(previo) if previo in nombres else 0, format_func=nombres.get, key=clave)
+    st.session_state[f"{clave}_id"] = id_sel
+    fila_sel = df_top[df_top["id_restaurant"]==id_sel].iloc[0]
+    establecimiento_sel = nombres[id_sel]
+    st.markdown(f"### {establecimiento_sel}")
+    k1,k2,k3,k4 = st.columns(4)
+    k1.metric("Ticket promedio", f"${float(fila_sel['ticketAvg']):,.2f}")
+    k2.metric("Tiempo de entrega promedio (minutos)", f"{float(fila_sel['deliveryTimeAvg']):.1f}")
+    k3.metric("Tiempo espera promedio (minutos)", f"{float(fila_sel['deliveryWaitTimeAvg']):.1f}")
+    k4.metric("Clientes únicos", f"{int(fila_sel['numClients'])}")
+    with medir_seccion("consulta_detalle"):
+        ejecutor = ejecutor_consultas()
+        futuro_detalle = ejecutor.submit(detalle_restaurante, id_sel, inicio_mes, fin_mes)
+        futuro_matriz = ejecutor.submit(matriz_diaria, anio_sel)
+        detalle, matriz = futuro_detalle.result(), futuro_matriz.result()
+    precargar_detalles([int(i) for i in df_top["id_restaurant"]], inicio_mes, fin_mes)
+    with medir_seccion("mapa_y_pagos"):
+        col_a, col_b = st.columns([1.2,1])
+        with col_a:
+            seccion_mapa(id_sel, inicio_mes, fin_mes, f"{mes_sel} {anio_sel}", f"map_{anio_sel}_{mes_num}_{id_sel}")
+        with col_b:
+            st.subheader("Pagos")
+            p1,p2,p3 = st.columns(3)
+            p1.metric("Tarjeta", int(fila_sel["ordersToCard"]))
+            p2.metric("Efectivo", int(fila_sel["ordersToCash"]))
+            p3.metric("Transferencia", int(fila_sel["ordersToTransference"]))
+    with medir_seccion("graficas"):
+        df_horas = detalle["horas"].copy()
+        df_diario_mes = matriz.diario(id_sel, inicio_mes, fin_mes)
+        pedidos_mes, dias_activos_mes, creditos_mes = detalle["resumen_mes"]
+        pedidos_ant, dias_activos_ant, creditos_ant = detalle["resumen_ant"]
+        prom_mes = pedidos_mes / dias_activos_mes if dias_activos_mes > 0 else 0
+        prom_ant = pedidos_ant / dias_activos_ant if dias_activos_ant > 0 else 0
+        d1 = f"{((pedidos_mes - pedidos_ant)/pedidos_ant*100):.1f}%" if pedidos_ant>0 else None
+        d2 = f"{((dias_activos_mes - dias_activos_ant)/dias_activos_ant*100):.1f}%" if dias_activos_ant>0 else None
+        d3 = f"{((prom_mes - prom_ant)/prom_ant*100):.1f}%" if prom_ant>0 else None
+        d4 = f"{((creditos_mes - creditos_ant)/creditos_ant*100):.1f}%" if creditos_ant>0 else None
+        m1,m2,m3 = st.columns(3)
+        m1.metric("Total de Pedidos", pedidos_mes, d1)
+        m2.metric("Días Activos", dias_activos_mes, d2)
+        m3.metric("Promedio de Pedidos por Día", f"{prom_mes:.1f}", d3)
+        #m4.metric("Créditos Usados", f"{creditos_mes:,.0f}", d4)
+        texto_picos, texto_semana = analisis_textual(df_horas, matriz.semanal(id_sel, inicio_mes, fin_mes), f"{mes_sel} {anio_sel}")
+        st.markdown(texto_picos)
+        st.markdown(texto_semana)
+        st.subheader(f"📊 Gráfica de Pedidos • {mes_sel} {anio_sel}")
+        fig_linea = go.Figure()
+        fig_linea.add_trace(go.Scatter(x=df_diario_mes["fecha"], y=df_diario_mes["pedidos"], mode="lines+markers", line=dict(width=2)))
+        fig_linea.update_layout(title=f"Pedidos por Día • {mes_sel} {anio_sel}", xaxis_title="Fecha", yaxis_title="Número de Pedidos", hovermode="x unified")
+        st.plotly_chart(fig_linea, use_container_width=True)
+        st.subheader("Pedidos por día de la semana")
+        st.plotly_chart(grafico_dias_semana_es(fila_sel), use_container_width=True)
+        if picos_semana is not None and not picos_semana.empty:
+            st.subheader("Ventana pico por día de la semana")
+            dias = ["Lunes","Martes","Miércoles","Jueves","Viernes","Sábado","Domingo"]
+            df_dias = picos_semana[picos_semana["id_restaurant"]==id_sel]
+            st.dataframe(pd.DataFrame({"Día": [dias[d] for d in df_dias["dia_semana"]], "Ventana pico": df_dias["ventanaPico"].fillna("Sin pedidos").to_numpy()}), hide_index=True, use_container_width=True)
+        st.subheader("Pedidos por hora")
+        if df_horas.empty:
+            st.warning("Sin pedidos por hora en el mes seleccionado.")
+        else:
+            df_horas = df_horas.sort_values("hora")
+            df_horas["Hora"] = df_horas["hora"].astype(int).astype(str).str.zfill(2)+":00"
+            fig_h = px.bar(df_horas, x="Hora", y="pedidos", text="pedidos", title=f"Pedidos por hora • {mes_sel} {anio_sel}")
+            fig_h.update_traces(textposition="outside")
+            st.plotly_chart(fig_h, use_container_width=True)
+        st.subheader("Pedidos por mes y tasa de cambio")
+        tabla_m, fig_m = tabla_y_grafico_mensual(matriz.mensual(id_sel))
+        st.plotly_chart(fig_m, use_container_width=True)
+        st.dataframe(tabla_m.fillna(0), hide_index=True, use_container_width=True)
+
 def app():
     st.title("🏆 Top 10 por Mes")
     hoy = datetime.now()
     anios = list(range(hoy.year-3, hoy.year+1))
     with st.sidebar:
+        if os.getenv('ADMIN_PANEL') == '1':
+            panel_administracion()
         st.header("Periodo")
         anio_sel = st.selectbox("Año", anios, index=anios.index(hoy.year))
         mes_sel = st.selectbox("Mes", list(MESES_ES.values()), index=hoy.month-1)
     mes_num = [k for k,v in MESES_ES.items() if v == mes_sel][0]
     inicio_mes, fin_mes = limites_mes(anio_sel, mes_num)
-    df_top = consulta_top10_metricas(inicio_mes, fin_mes)
+    with medir_seccion("consulta_top"):
+        obtener_top = rollup_top10 if ROLLUP_DIR else consulta_top10_metricas
+        clave_paginas = f"top_paginas_{anio_sel}_{mes_num}"
+        paginas = st.session_state.get(clave_paginas, 1)
+        df_top = pd.concat(list(ejecutor_consultas().map(lambda i: obtener_top(inicio_mes, fin_mes, TOP_N, i*TOP_N), range(paginas))), ignore_index=True)
     if df_top.empty:
         st.info("Aún no hay datos para el mes seleccionado.")
         return
-    c1, c2 = st.columns([1.2,1])
-    with c1:
-        st.subheader(f"Top 10 • {mes_sel} {anio_sel}")
-        st.dataframe(tabla_top10(df_top), hide_index=True, use_container_width=True)
-    with c2:
-        cols_dias = ["Monday","Tuesday","Wednesday","Thursday","Friday","Saturday","Sunday"]
-        df_top["Pedidos Mes"] = df_top[cols_dias].sum(axis=1)
-        fig_top = px.bar(df_top.sort_values("Pedidos Mes", ascending=False), x="name_restaurant", y="Pedidos Mes", title="Top 10")
-        fig_top.update_layout(xaxis_title="Establecimiento", yaxis_title="Pedidos")
-        st.plotly_chart(fig_top, use_container_width=True)
-    with st.sidebar:
-        st.header("Establecimiento del Top 10")
-        opciones = df_top["name_restaurant"].tolist()
-        establecimiento_sel = st.selectbox("Selecciona", opciones, index=0)
-    fila_sel = df_top[df_top["name_restaurant"]==establecimiento_sel].iloc[0]
-    st.markdown(f"### {establecimiento_sel}")
-    k1,k2,k3,k4 = st.columns(4)
-    k1.metric("Ticket promedio", f"${float(fila_sel['ticketAvg']):,.2f}")
-    k2.metric("Tiempo de entrega promedio (minutos)", f"{float(fila_sel['deliveryTimeAvg']):.1f}")
-    k3.metric("Tiempo espera promedio (minutos)", f"{float(fila_sel['deliveryWaitTimeAvg']):.1f}")
-    k4.metric("Clientes únicos", f"{int(fila_sel['numClients'])}")
-    col_a, col_b = st.columns([1.2,1])
-    with col_a:
-        st.subheader(f"Mapa de Calor de Clientes • {mes_sel} {anio_sel}")
-        coords = consulta_coordenadas_mes(int(fila_sel["id_restaurant"]), inicio_mes, fin_mes)
-        mapa = mapa_calor(coords)
-        if mapa is None:
-            st.warning("Sin datos de ubicación para el mes seleccionado.")
-        else:
-            st_folium(mapa, width=1200, height=500, key=f"map_{anio_sel}_{mes_num}_{int(fila_sel['id_restaurant'])}")
-    with col_b:
-        st.subheader("Pagos")
-        p1,p2,p3 = st.columns(3)
-        p1.metric("Tarjeta", int(fila_sel["ordersToCard"]))
-        p2.metric("Efectivo", int(fila_sel["ordersToCash"]))
-        p3.metric("Transferencia", int(fila_sel["ordersToTransference"]))
-    df_horas = consulta_pedidos_hora_mes(int(fila_sel["id_restaurant"]), inicio_mes, fin_mes)
-    inicio_anio = datetime(anio_sel, 1, 1)
-    fin_anio = datetime(anio_sel, 12, 31, 23, 59, 59)
-    df_diario = consulta_diaria_restaurante(int(fila_sel["id_restaurant"]), inicio_anio, fin_anio).copy()
-    df_diario["fecha"] = pd.to_datetime(df_diario["fecha"])
-    inicio_mes_ts = pd.Timestamp(inicio_mes.year, inicio_mes.month, inicio_mes.day)
-    fin_mes_ts = pd.Timestamp(fin_mes.year, fin_mes.month, fin_mes.day)
-    df_diario_mes = df_diario[(df_diario["fecha"] >= inicio_mes_ts) & (df_diario["fecha"] <= fin_mes_ts)].copy()
-    pedidos_mes, dias_activos_mes, creditos_mes = consulta_resumen_mes(int(fila_sel["id_restaurant"]), inicio_mes, fin_mes)
-    inicio_ant, fin_ant = limites_mes(*(inicio_mes - relativedelta(months=1)).timetuple()[:2])
-    pedidos_ant, dias_activos_ant, creditos_ant = consulta_resumen_mes(int(fila_sel["id_restaurant"]), inicio_ant, fin_ant)
-    prom_mes = pedidos_mes / dias_activos_mes if dias_activos_mes > 0 else 0
-    prom_ant = pedidos_ant / dias_activos_ant if dias_activos_ant > 0 else 0
-    d1 = f"{((pedidos_mes - pedidos_ant)/pedidos_ant*100):.1f}%" if pedidos_ant>0 else None
-    d2 = f"{((dias_activos_mes - dias_activos_ant)/dias_activos_ant*100):.1f}%" if dias_activos_ant>0 else None
-    d3 = f"{((prom_mes - prom_ant)/prom_ant*100):.1f}%" if prom_ant>0 else None
-    d4 = f"{((creditos_mes - creditos_ant)/creditos_ant*100):.1f}%" if creditos_ant>0 else None
-    m1,m2,m3 = st.columns(3)
-    m1.metric("Total de Pedidos", pedidos_mes, d1)
-    m2.metric("Días Activos", dias_activos_mes, d2)
-    m3.metric("Promedio de Pedidos por Día", f"{prom_mes:.1f}", d3)
-    #m4.metric("Créditos Usados", f"{creditos_mes:,.0f}", d4)
-    texto_picos, texto_semana = analisis_textual(df_horas, df_diario_mes, f"{mes_sel} {anio_sel}")
-    st.markdown(texto_picos)
-    st.markdown(texto_semana)
-    st.subheader(f"📊 Gráfica de Pedidos • {mes_sel} {anio_sel}")
-    fig_linea = go.Figure()
-    fig_linea.add_trace(go.Scatter(x=df_diario_mes["fecha"], y=df_diario_mes["pedidos"], mode="lines+markers", line=dict(width=2)))
-    fig_linea.update_layout(title=f"Pedidos por Día • {mes_sel} {anio_sel}", xaxis_title="Fecha", yaxis_title="Número de Pedidos", hovermode="x unified")
-    st.plotly_chart(fig_linea, use_container_width=True)
-    st.subheader("Pedidos por día de la semana")
-    st.plotly_chart(grafico_dias_semana_es(fila_sel), use_container_width=True)
-    st.subheader("Pedidos por hora")
-    if df_horas.empty:
-        st.warning("Sin pedidos por hora en el mes seleccionado.")
-    else:
-        df_horas = df_horas.sort_values("hora")
-        df_horas["Hora"] = df_horas["hora"].astype(int).astype(str).str.zfill(2)+":00"
-        fig_h = px.bar(df_horas, x="Hora", y="pedidos", text="pedidos", title=f"Pedidos por hora • {mes_sel} {anio_sel}")
-        fig_h.update_traces(textposition="outside")
-        st.plotly_chart(fig_h, use_container_width=True)
-    st.subheader("Pedidos por mes y tasa de cambio")
-    tabla_m, fig_m = tabla_y_grafico_mensual(df_diario)
-    st.plotly_chart(fig_m, use_container_width=True)
-    st.dataframe(tabla_m.fillna(0), hide_index=True, use_container_width=True)
+    with medir_seccion("ventanas_pico"):
+        franjas = franjas_mes(anio_sel, mes_num)
+        picos = ventanas_pico_restaurantes(franjas, minutos=PICO_MINUTOS, circular=PICO_CIRCULAR)
+        picos_semana = ventanas_pico_restaurantes(franjas, minutos=PICO_MINUTOS, circular=PICO_CIRCULAR, por_dia_semana=True)
+        df_top = df_top.merge(picos, on="id_restaurant", how="left")
+    seccion_top(df_top, f"{mes_sel} {anio_sel}", clave_paginas, paginas)
+    seccion_detalle(df_top, anio_sel, mes_num, inicio_mes, fin_mes, picos_semana)
 
+# La interfaz solo se construye al ejecutar el script con Streamlit; importar el módulo
+# (p. ej. desde generar_reportes.py) no tiene efectos sobre la página.
 if __name__ == "__main__":
+    # Configuración de la página
+    st.set_page_config(page_title="Top 10 por Mes", page_icon="🏆", layout="wide")
+
+    # Verificar autenticación antes de mostrar la aplicación
+    if not check_password():
+        st.stop()  # No ejecutar el resto del código si no está autenticado
+
+    # Botón de logout en la sidebar
+    with st.sidebar:
+        st.markdown("---")
+        if st.button("🚪 Cerrar Sesión"):
+            st.session_state["password_correct"] = False
+            st.rerun()
+
     app()
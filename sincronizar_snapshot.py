@@ -0,0 +1,98 @@
+"""Sincroniza desde SQL Server la instantánea Parquet que usa el backend local del reporte.
+
+Uso:
+    python sincronizar_snapshot.py                 # una sincronización
+    python sincronizar_snapshot.py --cada 900      # sincroniza cada 15 minutos
+
+Los catálogos (`tbl_restaurants`, `ctl_payment`, `tbl_address_client`, `addresses`) se
+copian completos. De `tbl_orders` solo se guardan los pedidos completados de los últimos
+`--meses` meses; tras la primera carga se traen únicamente los pedidos desde la última
+fecha sincronizada menos `--solapamiento` días.
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from textwrap import dedent
+
+import pandas as pd
+import pyarrow as pa
+from dateutil.relativedelta import relativedelta
+
+import reporte
+
+logging.getLogger("streamlit").setLevel(logging.ERROR)
+
+CATALOGOS = {
+    "tbl_restaurants": ("SELECT id_restaurant, name_restaurant FROM [dev_apprisa_delivery].[dbo].tbl_restaurants", {"id_restaurant": pa.int32()}),
+    "ctl_payment": ("SELECT id_payment, payment FROM [dev_apprisa_delivery].[dbo].ctl_payment", {"id_payment": pa.int32()}),
+    "tbl_address_client": (
+        "SELECT id_address, TRY_CAST(latitude AS float) AS latitude, TRY_CAST(longitude AS float) AS longitude FROM [dev_apprisa_delivery].[dbo].tbl_address_client",
+        {"latitude": pa.float32(), "longitude": pa.float32()},
+    ),
+    "addresses": (
+        "SELECT ad_id, TRY_CAST(ad_latitude AS float) AS ad_latitude, TRY_CAST(ad_longitude AS float) AS ad_longitude FROM [dev_apprisa_delivery].[dbo].addresses",
+        {"ad_latitude": pa.float32(), "ad_longitude": pa.float32()},
+    ),
+}
+
+SQL_PEDIDOS = dedent("""
+    SELECT
+        id_order, restaurant, [status], order_completion_date, order_acceptance_date,
+        start_delivery_datetime, arrival_client_date, payment, total, costo_envio,
+        costo_creditos, id_address, addresses_id
+    FROM [dev_apprisa_delivery].[dbo].tbl_orders
+    WHERE [status] = 24 AND order_completion_date >= ?
+""")
+TIPOS_PEDIDOS = {"restaurant": pa.int32(), "status": pa.int32(), "payment": pa.int32(), "costo_creditos": pa.float32()}
+
+
+def _escribir(carpeta, tabla, df):
+    ruta = os.path.join(carpeta, f"{tabla}.parquet")
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    df.to_parquet(temporal, index=False)
+    os.replace(temporal, ruta)
+
+
+def sincronizar(carpeta, meses=24, solapamiento=2):
+    os.makedirs(carpeta, exist_ok=True)
+    for tabla, (sql, tipos) in CATALOGOS.items():
+        _escribir(carpeta, tabla, reporte.leer_sql(sql, None, tipos))
+
+    hoy = datetime.now()
+    desde = datetime(hoy.year, hoy.month, 1) - relativedelta(months=meses)
+    ruta = os.path.join(carpeta, "tbl_orders.parquet")
+    previo = None
+    marca = desde
+    if os.path.exists(ruta):
+        previo = pd.read_parquet(ruta)
+        if not previo.empty:
+            marca = max(desde, previo["order_completion_date"].max().to_pydatetime() - timedelta(days=solapamiento))
+        previo = previo[(previo["order_completion_date"] >= pd.Timestamp(desde)) & (previo["order_completion_date"] < pd.Timestamp(marca))]
+    nuevos = reporte.leer_sql(SQL_PEDIDOS, [marca], TIPOS_PEDIDOS)
+    pedidos = nuevos if previo is None else pd.concat([previo, nuevos], ignore_index=True)
+    pedidos = pedidos.drop_duplicates("id_order", keep="last").sort_values("order_completion_date", kind="stable")
+    # tbl_orders se escribe al final: su fecha de modificación marca la versión de la instantánea
+    _escribir(carpeta, "tbl_orders", pedidos)
+    return len(nuevos), len(pedidos)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sincroniza la instantánea local del reporte.")
+    parser.add_argument("--carpeta", default=reporte.SNAPSHOT_DIR, help="carpeta de la instantánea")
+    parser.add_argument("--meses", type=int, default=int(os.getenv("SNAPSHOT_MONTHS", 24)), help="meses de pedidos a conservar")
+    parser.add_argument("--solapamiento", type=int, default=2, help="días que se vuelven a traer en cada sincronización")
+    parser.add_argument("--cada", type=int, help="segundos entre sincronizaciones; sin este argumento sincroniza una vez")
+    args = parser.parse_args(argv)
+    while True:
+        inicio = time.perf_counter()
+        nuevos, total = sincronizar(args.carpeta, args.meses, args.solapamiento)
+        print(f"{datetime.now():%Y-%m-%d %H:%M:%S} instantánea actualizada: {nuevos} pedidos leídos, {total} en total ({time.perf_counter() - inicio:.1f} s)")
+        if not args.cada:
+            return
+        time.sleep(args.cada)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import pytest
+
+import reporte
+
+
+class Principal:
+    def __init__(self):
+        self.llamadas = 0
+
+    def top10_metricas(self, *args):
+        self.llamadas += 1
+        raise reporte.pyodbc.Error("servidor caído")
+
+
+class Respaldo:
+    def top10_metricas(self, *args):
+        return "instantánea"
+
+
+@pytest.fixture(autouse=True)
+def sin_caida():
+    reporte._caida_principal.clear()
+
+
+def test_sin_instantanea_propaga_el_error_del_principal():
+    principal = Principal()
+    backend = reporte.BackendConRespaldo(principal, Respaldo, lambda: False)
+    for _ in range(2):
+        with pytest.raises(reporte.pyodbc.Error, match="servidor caído"):
+            backend.top10_metricas(1)
+    assert principal.llamadas == 2
+
+
+def test_tras_un_fallo_va_directo_al_respaldo(monkeypatch):
+    monkeypatch.setattr(reporte, "DB_RETRY_SECONDS", 60)
+    principal = Principal()
+    backend = reporte.BackendConRespaldo(principal, Respaldo, lambda: True)
+    with reporte.medir_consulta("prueba") as medicion:
+        assert backend.top10_metricas(1) == "instantánea"
+        assert backend.top10_metricas(1) == "instantánea"
+    assert principal.llamadas == 1
+    assert medicion["respaldo"]
@@ -0,0 +1,96 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import reporte
+
+
+def _consultar(carpeta, clave, barrera, resultados):
+    cache = reporte.CacheCompartida(carpeta, 2**30)
+    barrera.wait()
+
+    def calcular():
+        # Cada cálculo deja una marca para contar cuántos procesos ejecutaron la consulta
+        with open(os.path.join(carpeta, f"calculo-{clave}-{os.getpid()}"), "w"):
+            pass
+        time.sleep(1)
+        return (clave, os.getpid()), 60
+
+    origen, valor, _ = cache.obtener_o_calcular((clave,), calcular)
+    resultados.put((clave, origen, valor))
+
+
+@pytest.mark.skipif(reporte.fcntl is None, reason="sin flock no hay una sola ejecución por clave")
+def test_una_sola_ejecucion_por_clave_entre_procesos(tmp_path):
+    contexto = multiprocessing.get_context("spawn")
+    claves = ["a", "b", "c"] * 2
+    barrera = contexto.Barrier(len(claves))
+    resultados = contexto.Queue()
+    procesos = [contexto.Process(target=_consultar, args=(str(tmp_path), clave, barrera, resultados)) for clave in claves]
+    for proceso in procesos:
+        proceso.start()
+    salida = [resultados.get(timeout=120) for _ in procesos]
+    for proceso in procesos:
+        proceso.join()
+
+    assert len([n for n in os.listdir(tmp_path) if n.startswith("calculo-")]) == 3
+    for clave in set(claves):
+        de_la_clave = [s for s in salida if s[0] == clave]
+        assert sorted(s[1] for s in de_la_clave) == ["espera", "miss"]
+        assert de_la_clave[0][2] == de_la_clave[1][2]
+
+
+@pytest.mark.skipif(reporte.fcntl is None, reason="requiere flock")
+def test_plazo_de_espera_vencido_calcula_localmente(tmp_path, monkeypatch):
+    monkeypatch.setattr(reporte, "SHARED_CACHE_LOCK_SECONDS", 0.2)
+    cache = reporte.CacheCompartida(str(tmp_path), 2**30)
+    with open(f"{cache._ruta(('k',))}.lock", "ab") as ajeno:
+        reporte.fcntl.flock(ajeno, reporte.fcntl.LOCK_EX)
+        assert cache.obtener_o_calcular(("k",), lambda: (1, 60))[:2] == ("miss", 1)
+
+
+@pytest.mark.skipif(reporte.fcntl is None, reason="requiere flock")
+def test_poda_borra_candados_de_claves_vencidas_que_nadie_usa(tmp_path):
+    cache = reporte.CacheCompartida(str(tmp_path), 2**30)
+    cache.obtener_o_calcular(("vigente",), lambda: (1, 60))
+    cache.obtener_o_calcular(("vencida",), lambda: (2, -1))
+    cache.obtener_o_calcular(("en_curso",), lambda: (3, -1))
+    en_curso = cache._ruta(("en_curso",))
+    with open(f"{en_curso}.lock", "ab") as ajeno:
+        reporte.fcntl.flock(ajeno, reporte.fcntl.LOCK_EX)
+        cache._podar()
+    restantes = set(os.listdir(tmp_path))
+    vigente, vencida = (os.path.basename(cache._ruta((k,))) for k in ("vigente", "vencida"))
+    assert {f"{vigente}.pkl", f"{vigente}.lock", f"{os.path.basename(en_curso)}.lock"} <= restantes
+    assert not {f"{vencida}.pkl", f"{vencida}.lock"} & restantes
+
+
+@pytest.mark.skipif(reporte.fcntl is None, reason="requiere flock")
+def test_candado_borrado_mientras_se_espera_se_vuelve_a_abrir(tmp_path, monkeypatch):
+    cache = reporte.CacheCompartida(str(tmp_path), 2**30)
+    ruta = cache._ruta(("k",))
+    flock = reporte.fcntl.flock
+    borrado = []
+
+    def flock_con_poda(archivo, operacion):
+        # La poda de otro proceso borra el candado justo antes de que este lo tome
+        if not borrado:
+            borrado.append(True)
+            os.remove(f"{ruta}.lock")
+        return flock(archivo, operacion)
+
+    monkeypatch.setattr(reporte.fcntl, "flock", flock_con_poda)
+    candado = cache._tomar_candado(ruta)
+    with candado:
+        assert borrado
+        assert os.fstat(candado.fileno()).st_ino == os.stat(f"{ruta}.lock").st_ino
+
+
+def test_sin_flock_calcula_sin_candados(tmp_path, monkeypatch):
+    monkeypatch.setattr(reporte, "fcntl", None)
+    cache = reporte.CacheCompartida(str(tmp_path), 1)
+    assert cache.obtener_o_calcular(("k",), lambda: ("valor", 60))[:2] == ("miss", "valor")
+    assert cache.obtener_o_calcular(("j",), lambda: ("otro", 60))[:2] == ("miss", "otro")
+    assert not [n for n in os.listdir(tmp_path) if n.endswith(".lock")]
@@ -0,0 +1,87 @@
+import gc
+
+import pytest
+
+import reporte
+
+
+class Cursor:
+    description = [("lat", float), ("lon", float)]
+
+    def __init__(self, filas, fallar_en=None):
+        self._filas = filas
+        self._fallar_en = fallar_en
+        self._lecturas = 0
+
+    def execute(self, sql, params):
+        pass
+
+    def fetchmany(self, n):
+        self._lecturas += 1
+        if self._lecturas == self._fallar_en:
+            raise reporte.pyodbc.Error("conexión perdida")
+        lote, self._filas = self._filas[:n], self._filas[n:]
+        return lote
+
+    def close(self):
+        pass
+
+
+class Pool:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.devueltas = []
+
+    def cursor(self):
+        return self._cursor
+
+    def obtener(self):
+        return self
+
+    def devolver(self, conn, descartar=False):
+        self.devueltas.append(descartar)
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    def crear(filas, fallar_en=None):
+        pool = Pool(Cursor(filas, fallar_en))
+        monkeypatch.setattr(reporte, "pool_conexiones", lambda: pool)
+        return pool
+    return crear
+
+
+FILAS = [(19.4 + i, -99.1) for i in range(5)]
+
+
+def test_lotes_completos_devuelven_la_conexion(pool):
+    p = pool(FILAS)
+    lotes = list(reporte.leer_sql_lotes("SELECT", lote=2))
+    assert [len(df) for df in lotes] == [2, 2, 1]
+    assert p.devueltas == [False]
+
+
+def test_lector_sin_iterar_devuelve_la_conexion_al_recolectarse(pool):
+    p = pool(FILAS)
+    lector = reporte.leer_sql_lotes("SELECT", lote=2)
+    assert p.devueltas == []
+    del lector
+    gc.collect()
+    assert p.devueltas == [False]
+
+
+def test_lectura_abandonada_dentro_de_with(pool):
+    p = pool(FILAS)
+    with reporte.leer_sql_lotes("SELECT", lote=2) as lector:
+        next(lector)
+    assert p.devueltas == [False]
+    assert list(lector) == []
+
+
+def test_error_a_mitad_de_la_lectura_descarta_la_conexion(pool):
+    p = pool(FILAS, fallar_en=2)
+    lector = reporte.leer_sql_lotes("SELECT", lote=2)
+    next(lector)
+    with pytest.raises(reporte.pyodbc.Error):
+        next(lector)
+    assert p.devueltas == [True]
@@ -0,0 +1,87 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import benchmark
+import reporte
+
+
+class Reloj(datetime):
+    ahora = None
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls.ahora
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(reporte, "DATA_BACKEND", "local")
+    monkeypatch.setattr(reporte, "SNAPSHOT_DIR", str(tmp_path / "snapshot"))
+    monkeypatch.setattr(reporte, "ROLLUP_DIR", str(tmp_path / "rollups"))
+    monkeypatch.setattr(reporte, "ROLLUP_REFRESH_SECONDS", 0)
+    monkeypatch.setattr(reporte, "SHARED_CACHE_DIR", "")
+    monkeypatch.setattr(reporte, "datetime", Reloj)
+    for recurso in (reporte.cache_consultas, reporte.cache_compartida, reporte._motor_local):
+        recurso.clear()
+    tablas = benchmark.generar_datos(5, 2000, 1, fin=datetime(2025, 4, 1), semilla=1)
+    os.makedirs(reporte.SNAPSHOT_DIR)
+    version = [0]
+
+    def publicar(pedidos, ahora):
+        """Escribe la instantánea con `pedidos` y fija el reloj del reporte en `ahora`."""
+        for nombre, df in {**tablas, "tbl_orders": pedidos}.items():
+            df.to_parquet(os.path.join(reporte.SNAPSHOT_DIR, f"{nombre}.parquet"), index=False)
+        version[0] += 1
+        os.utime(os.path.join(reporte.SNAPSHOT_DIR, "tbl_orders.parquet"), (version[0], version[0]))
+        Reloj.ahora = ahora
+
+    return tablas["tbl_orders"], publicar
+
+
+def _ordenar(df):
+    df = df.assign(fecha=pd.to_datetime(df["fecha"]), hora=df["hora"].astype(int), pedidos=df["pedidos"].astype(int))
+    return df.sort_values(["id_restaurant", "fecha", "hora"]).reset_index(drop=True)[reporte.COLUMNAS_ROLLUP]
+
+
+def test_actualizacion_recoge_pedidos_tardios_del_solapamiento(almacen):
+    pedidos, publicar = almacen
+    fecha = pedidos["order_completion_date"]
+    corte = datetime(2025, 3, 20, 10)
+    # Pedidos ya completados pero que la base todavía no reporta en la primera lectura
+    tardios = (fecha > datetime(2025, 3, 19, 12)) & (fecha <= corte) & (np.random.default_rng(0).random(len(pedidos)) < 0.3)
+    assert tardios.any()
+
+    publicar(pedidos[(fecha <= corte) & ~tardios], datetime(2025, 3, 20, 12))
+    primera = reporte.rollup_pedidos(2025, 3)
+    publicar(pedidos[fecha <= datetime(2025, 3, 25)], datetime(2025, 3, 25, 6))
+    segunda = reporte.rollup_pedidos(2025, 3)
+
+    inicio, fin = reporte.limites_mes(2025, 3)
+    completo, _ = reporte.consulta_pedidos_agregados(inicio - pd.Timedelta(microseconds=1), fin)
+    assert primera["pedidos"].sum() < segunda["pedidos"].sum()
+    pd.testing.assert_frame_equal(_ordenar(segunda), _ordenar(completo), check_dtype=False)
+    assert _ordenar(pd.read_parquet(reporte._ruta_rollup("pedidos", 2025, 3))).equals(_ordenar(segunda))
+
+
+def test_mes_se_congela_al_terminar_el_solapamiento(almacen):
+    pedidos, publicar = almacen
+    inicio, fin = reporte.limites_mes(2025, 3)
+    ruta_top = reporte._ruta_rollup("top3+0", 2025, 3)
+
+    publicar(pedidos, datetime(2025, 4, 1, 12))
+    reporte.rollup_pedidos(2025, 3)
+    assert reporte._leer_meta_rollup(reporte._ruta_rollup("pedidos", 2025, 3))["cerrado"] == "0"
+    reporte.rollup_top10(inicio, fin, 3, 0)
+    assert not os.path.exists(ruta_top)
+    vigencias = [e[2] for clave, e in reporte.cache_consultas()._datos.items() if clave[0] == "consulta_top10_metricas"]
+    assert vigencias and all(v - reporte.time.monotonic() <= reporte.CACHE_TTL_ABIERTO for v in vigencias)
+
+    Reloj.ahora = fin + reporte.ROLLUP_SOLAPAMIENTO + pd.Timedelta(hours=1)
+    reporte.rollup_pedidos(2025, 3)
+    assert reporte._leer_meta_rollup(reporte._ruta_rollup("pedidos", 2025, 3))["cerrado"] == "1"
+    reporte.rollup_top10(inicio, fin, 3, 0)
+    assert os.path.exists(ruta_top)
@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+import reporte
+
+
+def ventana_pico_bucle(df_horas, cobertura=0.8):
+    """Implementación original por fuerza bruta, usada como referencia."""
+    if df_horas.empty: return None
+    base = pd.DataFrame({"hora": list(range(24))}).merge(df_horas, on="hora", how="left").fillna({"pedidos":0})
+    total = int(base["pedidos"].sum())
+    if total == 0: return None
+    objetivo = total * cobertura
+    mejor_inicio, mejor_fin, mejor_ancho, mejor_suma = 0, 23, 24, 0
+    for ancho in range(1,25):
+        for inicio in range(0,24-ancho+1):
+            fin = inicio + ancho - 1
+            suma = int(base.loc[(base["hora"]>=inicio)&(base["hora"]<=fin),"pedidos"].sum())
+            if suma >= objetivo:
+                if ancho < mejor_ancho or (ancho == mejor_ancho and suma > mejor_suma):
+                    mejor_inicio, mejor_fin, mejor_ancho, mejor_suma = inicio, fin, ancho, suma
+        if mejor_suma >= objetivo: break
+    return mejor_inicio, mejor_fin, 100*mejor_suma/total, total
+
+
+def horas_aleatorias(rng):
+    horas = rng.choice(24, size=rng.integers(1, 25), replace=False)
+    pedidos = rng.integers(0, 50, size=len(horas)) * (rng.random(len(horas)) < 0.8)
+    return pd.DataFrame({"hora": horas, "pedidos": pedidos})
+
+
+def test_ventana_pico_horaria_igual_al_bucle():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        df = horas_aleatorias(rng)
+        cobertura = float(rng.choice([0.5, 0.8, 0.95, 1.0]))
+        esperado = ventana_pico_bucle(df, cobertura)
+        obtenido = reporte.ventana_pico_horaria(df, cobertura)
+        if esperado is None:
+            assert obtenido is None
+        else:
+            assert obtenido[:2] == esperado[:2] and obtenido[3] == esperado[3]
+            assert abs(obtenido[2] - esperado[2]) < 1e-9
+
+
+def test_ranking_usa_el_mismo_fin_que_el_detalle():
+    rng = np.random.default_rng(1)
+    filas = []
+    for id_restaurant in range(1, 40):
+        df = horas_aleatorias(rng)
+        filas.append(df.assign(id_restaurant=id_restaurant))
+    df_horas = pd.concat(filas, ignore_index=True)
+    franjas = df_horas.assign(minuto=df_horas["hora"] * 60)[["id_restaurant", "minuto", "pedidos"]]
+    picos = reporte.ventanas_pico_restaurantes(franjas, 0.8).set_index("id_restaurant")["ventanaPico"]
+    for id_restaurant, df in df_horas.groupby("id_restaurant"):
+        esperado = ventana_pico_bucle(df[["hora", "pedidos"]], 0.8)
+        if esperado is None:
+            assert picos[id_restaurant] is None
+        else:
+            hi, hf, porcentaje, _ = esperado
+            assert picos[id_restaurant] == f"{hi:02d}:00 - {hf:02d}:00 ({porcentaje:.0f}%)"
+
+
+def ventana_pico_referencia(serie, cobertura, circular):
+    """Fuerza bruta sobre una serie: ancho mínimo, luego suma máxima y primer inicio."""
+    b = len(serie)
+    objetivo = sum(serie) * cobertura
+    doble = serie * 2
+    for ancho in range(1, b + 1):
+        inicios = range(b) if circular else range(b - ancho + 1)
+        candidatas = [(sum(doble[i : i + ancho]), i) for i in inicios]
+        suma = max(s for s, _ in candidatas)
+        if suma >= objetivo:
+            return next(i for s, i in candidatas if s == suma), ancho, suma
+
+
+def series_aleatorias(rng, franjas, n):
+    conteos = rng.integers(0, 30, size=(n, franjas)) * (rng.random((n, franjas)) < 0.5)
+    # Series concentradas en los extremos para que la ventana circular cruce el final
+    conteos[::3, franjas // 4 : -(franjas // 4) or None] = 0
+    return conteos
+
+
+def comprobar(conteos, cobertura, circular):
+    inicio, ancho, suma, total = reporte.ventanas_pico(conteos, cobertura, circular)
+    for indice in np.ndindex(conteos.shape[:-1]):
+        serie = conteos[indice].tolist()
+        assert total[indice] == sum(serie)
+        if total[indice] == 0:
+            assert ancho[indice] == 0
+        else:
+            assert (inicio[indice], ancho[indice], suma[indice]) == ventana_pico_referencia(serie, cobertura, circular)
+
+
+def test_ventanas_pico_igual_a_la_referencia():
+    rng = np.random.default_rng(2)
+    for franjas in (7, 24, 96):
+        for circular in (False, True):
+            for cobertura in (0.5, 0.8, 1.0):
+                comprobar(series_aleatorias(rng, franjas, 30), cobertura, circular)
+
+
+def test_ventanas_pico_circular_cruza_la_medianoche():
+    conteos = np.zeros(24, dtype=np.int64)
+    conteos[[22, 23, 0]] = 10
+    inicio, ancho, _, _ = reporte.ventanas_pico(conteos, 1.0, circular=True)
+    assert (inicio, ancho) == (22, 3)
+    inicio, ancho, _, _ = reporte.ventanas_pico(conteos, 1.0)
+    assert (inicio, ancho) == (0, 24)
+
+
+def test_ventanas_pico_multidimensional():
+    rng = np.random.default_rng(3)
+    conteos = series_aleatorias(rng, 24, 5 * 7).reshape(5, 7, 24)
+    for circular in (False, True):
+        comprobar(conteos, 0.8, circular)
+        plano = reporte.ventanas_pico(conteos.reshape(-1, 24), 0.8, circular)
+        for a, b in zip(reporte.ventanas_pico(conteos, 0.8, circular), plano):
+            assert a.shape == (5, 7) and (a.ravel() == b).all()
+
+
+def test_ventanas_pico_por_dia_de_la_semana():
+    rng = np.random.default_rng(4)
+    conteos = series_aleatorias(rng, 96, 6 * 7).reshape(6, 7, 96)
+    r, d, f = np.nonzero(conteos)
+    franjas = pd.DataFrame({"id_restaurant": r + 1, "dia_semana": d, "minuto": f * 15, "pedidos": conteos[r, d, f]})
+    for circular in (False, True):
+        picos = reporte.ventanas_pico_restaurantes(franjas, 0.8, minutos=15, circular=circular, por_dia_semana=True)
+        picos = picos.set_index(["id_restaurant", "dia_semana"])["ventanaPico"]
+        for fila in np.unique(r):
+            for dia in range(7):
+                serie = conteos[fila, dia].tolist()
+                if sum(serie) == 0:
+                    assert picos[(fila + 1, dia)] is None
+                    continue
+                inicio, ancho, suma = ventana_pico_referencia(serie, 0.8, circular)
+                fin = (inicio + ancho - 1) % 96
+                esperado = f"{inicio // 4:02d}:{inicio % 4 * 15:02d} - {fin // 4:02d}:{fin % 4 * 15:02d} ({100 * suma / sum(serie):.0f}%)"
+                assert picos[(fila + 1, dia)] == esperado